@@ -0,0 +1,162 @@
+import config
+import concurrent.futures
+import functools
+import threading
+import time
+from communicator import BoxInterface, BoxStatus, HouseMode
+from typing import Callable, Dict, List, Optional, Set
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AggregateBoxInterface(BoxInterface):
+    """
+    Home automation status merged from several sources, e.g. the home automation box and the controllers of
+    additional zones.
+
+    The sources are read concurrently by a bounded thread pool, and the sources that did not answer within the source
+    timeout are reported in the unavailable_sources of the status instead of delaying the refresh: the status stays
+    valid as long as one source could be read, and the last known values of the unavailable sources are kept. A source
+    still busy with a previous read is not read again until it answers. The lights on and doors opened of all the
+    sources are merged; the house mode comes from the first source, which also receives the house mode writes, and the
+    outside temperature from the first source providing one.
+
+    The sources without refresh interval are read on each refresh; the others, e.g. a source notifying its changes,
+    only when they notified a change or their refresh interval elapsed, and the first source after a house mode write.
+    """
+
+    def __init__(self, sources: Dict[str, BoxInterface], source_timeout: float = config.AGGREGATE_SOURCE_TIMEOUT,
+                 max_workers: int = config.AGGREGATE_MAX_WORKERS):
+        if not sources:
+            raise ValueError("At least one source is required")
+
+        self.__sources = sources
+        self.__primary_name = next(iter(sources))
+        self.__source_timeout = source_timeout
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(sources)),
+                                                                thread_name_prefix="AggregateBox")
+
+        # Reads still running, last valid status and time of the next read (for the sources with a refresh interval),
+        # per source name
+        self.__pending_reads: Dict[str, concurrent.futures.Future] = {}
+        self.__last_statuses: Dict[str, BoxStatus] = {}
+        self.__next_reads: Dict[str, float] = {}
+
+        # Sources that notified a change since they were last read
+        self.__lock = threading.Lock()
+        self.__notified_sources: Set[str] = set()
+
+        # Last merged status, returned as is while the statuses of the sources do not change
+        self.__merged_status: Optional[BoxStatus] = None
+        self.__merged_source_statuses: List[Optional[BoxStatus]] = []
+
+    @property
+    def refresh_interval(self) -> Optional[float]:
+        intervals = [source.refresh_interval for source in self.__sources.values()]
+        if None in intervals:
+            # The sources without refresh interval are polled at the communicator's own interval
+            return None
+        return min(intervals)
+
+    def set_status_listener(self, listener: Optional[Callable[[], None]]):
+        for name, source in self.__sources.items():
+            source.set_status_listener(functools.partial(self.__on_source_notified, name, listener)
+                                       if listener is not None else None)
+
+    def read_status(self) -> BoxStatus:
+        start_time = time.monotonic()
+        with self.__lock:
+            notified_sources = self.__notified_sources
+            self.__notified_sources = set()
+
+        # Read the sources that are due, unless a previous read is still running
+        read_names = []
+        for name, source in self.__sources.items():
+            interval = source.refresh_interval
+            if interval is not None and name in self.__last_statuses and name not in notified_sources \
+                    and start_time < self.__next_reads.get(name, 0):
+                continue
+            read_names.append(name)
+            if name not in self.__pending_reads:
+                self.__pending_reads[name] = self.__executor.submit(source.read_status)
+                if interval is not None:
+                    self.__next_reads[name] = start_time + interval
+        if read_names:
+            concurrent.futures.wait([self.__pending_reads[name] for name in read_names],
+                                    timeout=self.__source_timeout)
+
+        unavailable_sources: List[str] = []
+        for name in read_names:
+            future = self.__pending_reads[name]
+            if not future.done():
+                LOGGER.warning(f"Source '{name}' did not answer within {self.__source_timeout}s")
+                unavailable_sources.append(name)
+                continue
+
+            del self.__pending_reads[name]
+            try:
+                status = future.result()
+            except Exception as err:
+                LOGGER.error(f"Failed to read the status of source '{name}': {err}")
+                status = None
+            if status is not None and status.is_valid:
+                self.__last_statuses[name] = status
+            else:
+                unavailable_sources.append(name)
+
+        LOGGER.debug(f"{len(read_names) - len(unavailable_sources)} of {len(read_names)} sources read in "
+                     f"{(time.monotonic() - start_time) * 1000:.1f}ms")
+        return self.__merge(unavailable_sources)
+
+    def write_house_mode(self, mode: HouseMode) -> bool:
+        result = self.__sources[self.__primary_name].write_house_mode(mode)
+
+        # The next refresh must read the written mode back, even if the primary source is not due
+        with self.__lock:
+            self.__notified_sources.add(self.__primary_name)
+        return result
+
+    def close(self):
+        """ Stops the thread pool without waiting for the reads still running """
+        for future in self.__pending_reads.values():
+            future.cancel()
+        self.__executor.shutdown(wait=False)
+
+    def __on_source_notified(self, name: str, listener: Callable[[], None]):
+        """ Called from any thread when a source notifies that its status changed """
+        with self.__lock:
+            self.__notified_sources.add(name)
+        listener()
+
+    def __merge(self, unavailable_sources: List[str]) -> BoxStatus:
+        """
+        Merges the last valid statuses of the sources, in the order of the sources, or returns the previous merged
+        status if none of them changed
+        """
+        if len(unavailable_sources) == len(self.__sources):
+            return BoxStatus(is_valid=False, lights_on=[], doors_opened=[], house_mode=None, outside_temperature=None,
+                             unavailable_sources=unavailable_sources)
+
+        source_statuses = [self.__last_statuses.get(name) for name in self.__sources]
+        if self.__merged_status is not None and self.__merged_status.unavailable_sources == unavailable_sources \
+                and all(status is merged_status for status, merged_status
+                        in zip(source_statuses, self.__merged_source_statuses)):
+            return self.__merged_status
+
+        statuses = [status for status in source_statuses if status is not None]
+        primary_status = self.__last_statuses.get(self.__primary_name)
+        temperatures = [status.outside_temperature for status in statuses if status.outside_temperature is not None]
+        timestamps = [status.timestamp for status in statuses if status.timestamp is not None]
+        received_times = [status.received_time for status in statuses if status.received_time is not None]
+        self.__merged_source_statuses = source_statuses
+        self.__merged_status = BoxStatus(
+            is_valid=True,
+            lights_on=[light for status in statuses for light in status.lights_on],
+            doors_opened=[door for status in statuses for door in status.doors_opened],
+            outside_temperature=temperatures[0] if temperatures else None,
+            house_mode=primary_status.house_mode if primary_status is not None else None,
+            timestamp=max(timestamps) if timestamps else None,
+            received_time=max(received_times) if received_times else None,
+            unavailable_sources=unavailable_sources)
+        return self.__merged_status
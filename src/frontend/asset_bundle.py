@@ -0,0 +1,217 @@
+import config
+import pygame
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Bundle file layout: header (magic, version, metadata length), JSON metadata, then the atlas pixels (one row after the
+# other) at the offset given by the metadata, followed by the font files at offsets relative to the atlas
+BUNDLE_MAGIC = b"DPAB"
+BUNDLE_VERSION = 3
+BUNDLE_HEADER = struct.Struct("<4sII")
+
+# Pixel format of the atlas: the format of the surfaces converted by convert_alpha(), so that the atlas is blitted
+# straight from the bundle file without conversion
+ATLAS_FORMAT = "BGRA"
+
+# Maximum width of the image atlas, in pixels
+ATLAS_MAX_WIDTH = 1024
+
+
+class AssetBundle:
+    """
+    User interface assets precompiled into a single file by build_asset_bundle(): the images packed into one atlas, the
+    fonts and the theme. The file is memory-mapped and the atlas pixels are used in place.
+    """
+
+    def __init__(self, file_path: str):
+        with open(file_path, "rb") as file:
+            self.__mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, metadata_length = BUNDLE_HEADER.unpack_from(self.__mmap, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError(f"'{file_path}' is not a version {BUNDLE_VERSION} asset bundle")
+        metadata = json.loads(self.__mmap[BUNDLE_HEADER.size:BUNDLE_HEADER.size + metadata_length])
+
+        self.__sources: Dict[str, str] = metadata["sources"]
+        self.__theme: str = metadata["theme"]
+
+        self.__fonts: Dict[str, List[List[int]]] = metadata["fonts"]
+        self.__fonts_offset: int = metadata["atlas"]["offset"]
+
+        # Every image is a subsurface of the atlas, which is only converted if the display expects another format
+        atlas = metadata["atlas"]
+        atlas_size = (atlas["width"], atlas["height"])
+        pixels = memoryview(self.__mmap)[atlas["offset"]:atlas["offset"] + atlas["width"] * atlas["height"] * 4]
+        self.__atlas = pygame.image.frombuffer(pixels, atlas_size, atlas["format"])
+        if pygame.display.get_surface() is not None:
+            display_format = pygame.Surface((1, 1), pygame.SRCALPHA, 32).convert_alpha()
+            if self.__atlas.get_masks() != display_format.get_masks():
+                LOGGER.debug(f"Converting the asset bundle atlas to the display format {display_format.get_masks()}")
+                self.__atlas = self.__atlas.convert_alpha()
+        self.__images = {image_path: self.__atlas.subsurface(pygame.Rect(rect))
+                         for image_path, rect in metadata["images"].items()}
+
+    @property
+    def theme(self) -> io.StringIO:
+        """ Returns the theme, to be loaded with UIAppearanceTheme.load_theme() """
+        return io.StringIO(self.__theme)
+
+    def get_image(self, file_path: str) -> Optional[pygame.Surface]:
+        """ Returns the image built from the file, or None if the file is not in the bundle """
+        return self.__images.get(os.path.normpath(file_path))
+
+    def get_font(self, font_name: str) -> Optional[List[memoryview]]:
+        """
+        Returns the content of the regular, bold, italic and bold italic files of the font, as views of the bundle file,
+        or None if the font is not in the bundle
+        """
+        font = self.__fonts.get(font_name)
+        if font is None:
+            return None
+        start = self.__fonts_offset
+        data = memoryview(self.__mmap)
+        return [data[start + offset:start + offset + length] for offset, length in font]
+
+    def is_up_to_date(self) -> bool:
+        """
+        Returns True if the content of none of the bundled files changed since the bundle was built. The files are only
+        hashed by 'python asset_bundle.py --check', at installation, so that the startup only reads the bundle
+        """
+        try:
+            return all(get_file_hash(source_path) == file_hash for source_path, file_hash in self.__sources.items())
+        except OSError:
+            return False
+
+
+def get_file_hash(file_path: str) -> str:
+    """ Returns the SHA-256 hash of the file content """
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def build_asset_bundle(output_path: str, theme_path: str, image_paths: List[str], font_paths: Dict[str, List[str]]):
+    """
+    Packs the images into an atlas and writes it to the bundle file with the fonts (regular, bold, italic and bold
+    italic files per font name) and the theme
+    """
+    images = {os.path.normpath(image_path): pygame.image.load(image_path) for image_path in image_paths}
+
+    # Shelf packing: the images are placed in rows, tallest first
+    rects: Dict[str, Tuple[int, int, int, int]] = {}
+    x = y = shelf_height = atlas_width = 0
+    for image_path, image in sorted(images.items(), key=lambda item: item[1].get_height(), reverse=True):
+        width, height = image.get_size()
+        if x + width > ATLAS_MAX_WIDTH:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        rects[image_path] = (x, y, width, height)
+        x += width
+        shelf_height = max(shelf_height, height)
+        atlas_width = max(atlas_width, x)
+    atlas_height = y + shelf_height
+
+    atlas = pygame.Surface((max(1, atlas_width), max(1, atlas_height)), pygame.SRCALPHA, 32)
+    atlas.fill((0, 0, 0, 0))
+    for image_path, image in images.items():
+        atlas.blit(image, rects[image_path][:2])
+
+    # The theme is validated and minified
+    with open(theme_path, "r") as file:
+        theme = json.dumps(json.load(file), separators=(",", ":"))
+
+    # The fonts follow the atlas, at offsets relative to the atlas offset
+    atlas_pixels = pygame.image.tostring(atlas, ATLAS_FORMAT)
+    fonts: Dict[str, List[Tuple[int, int]]] = {}
+    font_data: List[bytes] = []
+    font_offset = len(atlas_pixels)
+    for font_name, paths in font_paths.items():
+        fonts[font_name] = []
+        for font_path in paths:
+            with open(font_path, "rb") as file:
+                data = file.read()
+            fonts[font_name].append((font_offset, len(data)))
+            font_data.append(data)
+            font_offset += len(data)
+
+    source_paths = [theme_path] + image_paths + [font_path for paths in font_paths.values() for font_path in paths]
+    metadata = {
+        "theme": theme,
+        "images": rects,
+        "fonts": fonts,
+        "sources": {source_path: get_file_hash(source_path) for source_path in source_paths},
+        "atlas": {"width": atlas.get_width(), "height": atlas.get_height(), "format": ATLAS_FORMAT, "offset": 0},
+    }
+
+    # The metadata holds the atlas offset: its length is computed with an offset longer than the real one, so that the
+    # real metadata fits before the atlas
+    metadata["atlas"]["offset"] = 10 ** 9
+    offset = BUNDLE_HEADER.size + len(json.dumps(metadata).encode())
+    offset = (offset + 15) // 16 * 16
+    metadata["atlas"]["offset"] = offset
+    metadata_bytes = json.dumps(metadata).encode()
+
+    with open(output_path, "wb") as file:
+        file.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(metadata_bytes)))
+        file.write(metadata_bytes)
+        file.write(b"\0" * (offset - BUNDLE_HEADER.size - len(metadata_bytes)))
+        file.write(atlas_pixels)
+        for data in font_data:
+            file.write(data)
+
+    LOGGER.info(f"Asset bundle '{output_path}' built: {len(images)} images in a {atlas.get_width()}x"
+                f"{atlas.get_height()} atlas, {len(font_data)} font files")
+
+
+def load_asset_bundle() -> Optional[AssetBundle]:
+    """
+    Loads the asset bundle set in the configuration, or returns None if it is disabled or missing. The bundle is not
+    compared with the asset files, which is done at installation by 'python asset_bundle.py --check'
+    """
+    if config.ASSET_BUNDLE_FILE == "" or not os.path.exists(config.ASSET_BUNDLE_FILE):
+        return None
+
+    try:
+        bundle = AssetBundle(config.ASSET_BUNDLE_FILE)
+    except Exception as err:
+        LOGGER.warning(f"Failed to load the asset bundle '{config.ASSET_BUNDLE_FILE}': {err}")
+        return None
+    return bundle
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Builds the asset bundle loaded by the frontend at startup")
+    parser.add_argument("--output", default=config.ASSET_BUNDLE_FILE, help="Path of the bundle file")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check that the bundle matches the asset files, exits with status 1 if it doesn't")
+    args = parser.parse_args()
+
+    pygame.init()
+    if args.check:
+        try:
+            is_up_to_date = AssetBundle(args.output).is_up_to_date()
+        except (OSError, ValueError) as err:
+            LOGGER.error(f"Cannot read the asset bundle '{args.output}': {err}")
+            is_up_to_date = False
+        if not is_up_to_date:
+            LOGGER.error(f"The asset bundle '{args.output}' is outdated, rebuild it with 'python asset_bundle.py'")
+            sys.exit(1)
+        LOGGER.info(f"The asset bundle '{args.output}' is up to date")
+    else:
+        from resources import UI_FONTS
+        build_asset_bundle(args.output,
+                           os.path.join("assets", "theme.json"),
+                           sorted(glob.glob(os.path.join("assets", "images", "*.png"))),
+                           UI_FONTS)
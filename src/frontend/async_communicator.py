@@ -0,0 +1,179 @@
+from communicator import BaseCommunicator, BoxInterface
+from status_cache import StatusCache
+from status_history import StatusHistory
+from refresh_scheduler import RefreshScheduler
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import config
+import asyncio
+import threading
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncCommunicator(BaseCommunicator):
+    """
+    Manages the home automation box communications from an asyncio event loop running in a background thread.
+
+    The box interface calls are blocking and run in a thread pool, so that a house mode write does not wait for a
+    status read in progress, and in-flight reads are abandoned when the communicator is stopped.
+    """
+
+    def __init__(self, box: BoxInterface, status_cache: Optional[StatusCache] = None,
+                 scheduler: Optional[RefreshScheduler] = None, status_history: Optional[StatusHistory] = None):
+        super().__init__(box, status_cache, scheduler, status_history)
+
+        self.__executor = ThreadPoolExecutor(max_workers=config.ASYNC_MAX_CONCURRENT_CALLS)
+        self.__lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Write and refresh events of each running event loop: a loop stopped and replaced by a new one may still be
+        # cancelling its tasks, which must keep using the events of their own loop
+        self.__loop_events: Dict[asyncio.AbstractEventLoop, Tuple[asyncio.Event, asyncio.Event]] = {}
+
+    def start(self):
+        with self.__lock:
+            is_running = self.__loop is not None
+        if self._take_suspended() and is_running:
+            # The event loop is still running: read the status right away
+            LOGGER.info("Resuming the home automation box background management")
+            self._check_staleness()
+            self._on_status_notified()
+            return
+
+        LOGGER.info("Starting the home automation box background management")
+
+        self._check_staleness()
+
+        loop = asyncio.new_event_loop()
+        with self.__lock:
+            self.__loop = loop
+        self.__thread = threading.Thread(target=self.__thread_main, args=(loop,))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        LOGGER.info("Stopping the home automation box background management")
+
+        self._take_suspended()
+        with self.__lock:
+            loop = self.__loop
+            self.__loop = None
+
+        if loop is not None:
+            loop.call_soon_threadsafe(self.__cancel, loop)
+
+    def _on_house_mode_requested(self):
+        with self.__lock:
+            if self.__loop is not None:
+                self.__loop.call_soon_threadsafe(self.__wake_writer, self.__loop)
+
+    def _on_status_notified(self):
+        with self.__lock:
+            if self.__loop is not None:
+                self.__loop.call_soon_threadsafe(self.__wake_reader, self.__loop)
+
+    def __thread_main(self, loop: asyncio.AbstractEventLoop):
+        """ Runs the event loop of the background management thread until the communicator is stopped """
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.__main())
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+            LOGGER.debug("Home automation box background management stopped")
+
+    @staticmethod
+    def __cancel(loop: asyncio.AbstractEventLoop):
+        """ Cancels the tasks of the event loop, and with them any call to the home automation box in progress """
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+
+    def __wake_writer(self, loop: asyncio.AbstractEventLoop):
+        """ Makes the writer of the event loop check the requested house mode; called from the event loop """
+        with self.__lock:
+            events = self.__loop_events.get(loop)
+        if events is not None:
+            events[0].set()
+
+    def __wake_reader(self, loop: asyncio.AbstractEventLoop):
+        """ Makes the reader of the event loop read the status right away; called from the event loop """
+        with self.__lock:
+            events = self.__loop_events.get(loop)
+        if events is not None:
+            events[1].set()
+
+    async def __main(self):
+        """ Runs the status reads and the house mode writes concurrently """
+        # The events are created in the running loop, which they are bound to
+        loop = asyncio.get_event_loop()
+        write_event = asyncio.Event()
+        refresh_event = asyncio.Event()
+        with self.__lock:
+            self.__loop_events[loop] = (write_event, refresh_event)
+
+        # Read the status right away
+        refresh_event.set()
+
+        writer_task = asyncio.ensure_future(self.__writer(write_event, refresh_event))
+        try:
+            await self.__reader(refresh_event)
+        finally:
+            writer_task.cancel()
+            await asyncio.gather(writer_task, return_exceptions=True)
+            with self.__lock:
+                del self.__loop_events[loop]
+            self._save_status()
+
+    async def __reader(self, refresh_event: asyncio.Event):
+        """ Reads the status of the home automation box periodically, or right after a house mode write """
+        loop = asyncio.get_event_loop()
+
+        while True:
+            # Wait for the next scheduled read, unless a house mode write or a status change notification preempts it
+            wait_time = self._get_next_refresh_delay()
+            LOGGER.debug(f"Next refresh in {wait_time:.1f} seconds")
+            try:
+                await asyncio.wait_for(refresh_event.wait(), wait_time)
+                refresh_event.clear()
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                new_status = await loop.run_in_executor(self.__executor, self._read_status)
+                self._on_status_read(new_status)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                LOGGER.error(f"Error while reading the home automation box status: {err}")
+
+    async def __writer(self, write_event: asyncio.Event, refresh_event: asyncio.Event):
+        """ Writes the requested house modes, once no other mode was requested for HOUSE_MODE_WRITE_DELAY seconds """
+        loop = asyncio.get_event_loop()
+
+        while True:
+            mode = self._take_house_mode_request()
+            if mode is None:
+                # Wait for a request, or for no other request to come for a while to coalesce rapid requests
+                delay = self._get_house_mode_write_delay()
+                try:
+                    await asyncio.wait_for(write_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                write_event.clear()
+                continue
+
+            success = False
+            try:
+                success = await loop.run_in_executor(self.__executor, self._write_house_mode, mode)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                LOGGER.error(f"Error while writing the house mode to the home automation box: {err}")
+
+            # Read back the status right away
+            self._on_house_mode_written(mode, success)
+            refresh_event.set()
@@ -0,0 +1,442 @@
+"""
+Headless benchmarks of the frontend and the communicator.
+
+Run them with `python benchmark.py` from this directory: nothing is displayed (SDL dummy video driver), the GPIO pins
+are mocked and the home automation box is a FakeBoxInterface. The results are written to a JSON file, which can be
+compared with the results of another commit with `python benchmark.py --compare <baseline file>`.
+"""
+import os
+
+# Must be set before the display is initialized
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import config
+import pygame
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+from communicator import Communicator, BoxStatus, HouseMode, BOX_STATUS_CHANGED
+from refresh_scheduler import FixedRefreshScheduler, AdaptiveRefreshScheduler
+from fake_box import FakeBoxInterface
+from status_history import StatusHistory
+from main_screen import MainScreen
+from display_power import FakeDisplayPowerBackend
+from tft_manager import TftManager, SCREEN_STATE_CHANGED
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+SCREEN_SIZE = (320, 240)
+
+# Centers of the house mode buttons of the main screen, tapped by the touch storm scenario
+HOUSE_MODE_BUTTON_POSITIONS = [(55, 95), (55, 155), (55, 215)]
+
+
+def get_percentile(values: List[float], ratio: float) -> float:
+    """ Returns the value below which the given ratio of the values fall """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def get_memory_usage() -> Optional[int]:
+    """ Returns the resident memory of the process in bytes, or None if it cannot be read on this system """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def create_status(index: int) -> BoxStatus:
+    """ Returns a status whose displayed values all depend on the index """
+    return BoxStatus(is_valid=True,
+                     lights_on=[f"light {light}" for light in range(index % 3)],
+                     doors_opened=[f"door {door}" for door in range(index % 2)],
+                     outside_temperature=round(10 + (index % 100) / 10, 1),
+                     house_mode=list(HouseMode)[index % len(HouseMode)],
+                     timestamp=time.time())
+
+
+def setup_headless():
+    """ Initializes PyGame without display and mocks the GPIO pins """
+    config.DEBUG_MODE = True
+    Device.pin_factory = MockFactory()
+    pygame.display.init()
+    pygame.init()
+
+
+def run_main_screen(frame_count: int, on_frame: Callable[[int, MainScreen], None]) -> Dict[str, float]:
+    """
+    Runs the main screen for a number of frames, as fast as possible, calling on_frame before each frame, and returns
+    the frame rate and the frame durations.
+    """
+    surface = pygame.display.set_mode(SCREEN_SIZE)
+    box = FakeBoxInterface()
+    communicator = Communicator(box, scheduler=FixedRefreshScheduler(), status_history=StatusHistory())
+    communicator.refresh()
+    screen = MainScreen(surface=surface, communicator=communicator)
+    screen.activate(None)
+
+    # Warm up: the first frame renders every widget
+    screen.run(0)
+    pygame.event.clear()
+
+    frame_durations = []
+    frame_cpu_durations = []
+    redrawn_area = 0
+    start = time.perf_counter()
+    for frame in range(frame_count):
+        frame_start = time.perf_counter()
+        frame_cpu_start = time.thread_time()
+
+        on_frame(frame, screen)
+        for event in pygame.event.get():
+            screen.handle_event(event)
+        screen.run(1 / config.FRAME_RATE)
+        if screen.dirty_rects:
+            pygame.display.update(screen.dirty_rects)
+            redrawn_area += sum(rect.width * rect.height for rect in screen.dirty_rects)
+
+        frame_cpu_durations.append(time.thread_time() - frame_cpu_start)
+        frame_durations.append(time.perf_counter() - frame_start)
+    duration = time.perf_counter() - start
+
+    screen.deactivate()
+    return {
+        "frames": frame_count,
+        "fps": frame_count / duration,
+        "frame_mean_ms": statistics.mean(frame_durations) * 1000,
+        "frame_p95_ms": get_percentile(frame_durations, 0.95) * 1000,
+        "frame_p99_ms": get_percentile(frame_durations, 0.99) * 1000,
+        "cpu_per_frame_ms": statistics.mean(frame_cpu_durations) * 1000,
+        "redrawn_pixels_per_frame": redrawn_area / frame_count,
+    }
+
+
+def benchmark_idle(frame_count: int) -> Dict[str, float]:
+    """ Main screen with a status that never changes: only the clock may be redrawn """
+    return run_main_screen(frame_count, lambda frame, screen: None)
+
+
+def benchmark_changing_status(frame_count: int) -> Dict[str, float]:
+    """ Main screen receiving a different status on every frame """
+    def on_frame(frame: int, screen: MainScreen):
+        pygame.event.post(pygame.event.Event(BOX_STATUS_CHANGED, status=create_status(frame)))
+
+    return run_main_screen(frame_count, on_frame)
+
+
+def benchmark_touch_storm(frame_count: int) -> Dict[str, float]:
+    """ Main screen receiving a finger motion and a tap on a house mode button on every frame """
+    def on_frame(frame: int, screen: MainScreen):
+        position = HOUSE_MODE_BUTTON_POSITIONS[frame % len(HOUSE_MODE_BUTTON_POSITIONS)]
+        pygame.event.post(pygame.event.Event(pygame.MOUSEMOTION, pos=position, rel=(1, 1), buttons=(0, 0, 0),
+                                             touch=True))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=position, button=1, touch=True))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=position, button=1, touch=True))
+
+    return run_main_screen(frame_count, on_frame)
+
+
+def wait_for_status(predicate: Callable[[BoxStatus], bool], timeout: float) -> Optional[BoxStatus]:
+    """ Waits for a BOX_STATUS_CHANGED event whose status matches the predicate, and returns its status """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        event = pygame.event.wait(max(1, int((deadline - time.monotonic()) * 1000)))
+        if event.type == BOX_STATUS_CHANGED and predicate(event.status):
+            return event.status
+    return None
+
+
+def benchmark_slow_communicator(duration: float, delay: float, interval: float) -> Dict[str, float]:
+    """
+    Communicator reading a box which takes delay seconds to answer, every interval seconds: measures the reads
+    throughput and the latency from a status change in the box to its BOX_STATUS_CHANGED event.
+    """
+    box = FakeBoxInterface(delay=delay)
+    communicator = Communicator(box, scheduler=FixedRefreshScheduler(normal_interval=interval))
+    pygame.event.clear()
+    communicator.start()
+
+    latencies = []
+    missed_changes = 0
+    start = time.perf_counter()
+    temperature = 0
+    while time.perf_counter() - start < duration:
+        temperature += 1
+        box.update_status(outside_temperature=temperature)
+        status = wait_for_status(lambda new_status: new_status.outside_temperature == temperature,
+                                 timeout=interval + 2 * delay + 1)
+        if status is None:
+            missed_changes += 1
+        else:
+            latencies.append(time.time() - status.timestamp)
+    elapsed = time.perf_counter() - start
+
+    communicator.stop()
+    return {
+        "box_delay_ms": delay * 1000,
+        "reads_per_second": box.read_count / elapsed,
+        "changes": temperature,
+        "missed_changes": missed_changes,
+        "latency_mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "latency_p95_ms": get_percentile(latencies, 0.95) * 1000 if latencies else 0.0,
+        "latency_max_ms": max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def benchmark_failing_communicator(duration: float, interval: float) -> Dict[str, float]:
+    """
+    Communicator reading a box that always fails, with the adaptive scheduler: measures how often the box is still
+    read, how long a house mode request blocks the caller and how long the optimistic mode takes to be rolled back.
+    """
+    box = FakeBoxInterface()
+    communicator = Communicator(box, scheduler=AdaptiveRefreshScheduler(normal_interval=interval))
+    communicator.refresh()
+    box.set_fail(True)
+    pygame.event.clear()
+    communicator.start()
+
+    # The first failed read marks the PRESENT status as stale: it must not be mistaken for a rollback
+    wait_for_status(lambda new_status: new_status.is_stale, timeout=1)
+
+    request_durations = []
+    rollback_durations = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        pygame.event.clear()
+        request_start = time.perf_counter()
+        communicator.set_house_mode(HouseMode.AWAY)
+        request_durations.append(time.perf_counter() - request_start)
+
+        status = wait_for_status(lambda new_status: new_status.house_mode == HouseMode.PRESENT
+                                 and not new_status.is_house_mode_pending,
+                                 timeout=config.HOUSE_MODE_WRITE_DELAY + 1)
+        if status is not None:
+            rollback_durations.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+
+    communicator.stop()
+    return {
+        "reads_per_second": (box.read_count - 1) / elapsed,
+        "writes": box.write_count,
+        "set_house_mode_p99_ms": get_percentile(request_durations, 0.99) * 1000,
+        "rollback_mean_ms": statistics.mean(rollback_durations) * 1000 if rollback_durations else 0.0,
+    }
+
+
+def benchmark_display_wake_up(runs: int, delay: float) -> Dict[str, float]:
+    """
+    Screen turned ON by the PIR sensor, with a display taking delay seconds to turn ON: measures how long the main loop
+    is blocked turning the screen ON, and the latency from the PIR sensor edge to the display ON.
+    """
+    display_power = FakeDisplayPowerBackend(delay=delay)
+    tft_manager = TftManager(pin_factory=Device.pin_factory, screen_timeout=0, display_power=display_power,
+                             presence_socket="")
+    pir_pin = Device.pin_factory.pin(config.PIN_PIR)
+
+    def wait_for_screen_state(is_on: bool):
+        deadline = time.monotonic() + 5
+        while tft_manager.is_on is not is_on and time.monotonic() < deadline:
+            event = pygame.event.wait(max(1, int((deadline - time.monotonic()) * 1000)))
+            if event.type == SCREEN_STATE_CHANGED:
+                tft_manager.update()
+
+    update_durations = []
+    apply_durations = []
+    wake_up_durations = []
+    wait_for_screen_state(True)
+    for _ in range(runs):
+        # The screen goes OFF as soon as the motion stops
+        pir_pin.drive_low()
+        wait_for_screen_state(False)
+        display_power.wait_idle()
+        pygame.event.clear()
+
+        start = time.monotonic()
+        pir_pin.drive_high()
+        event = pygame.event.wait(5000)
+        if event.type != SCREEN_STATE_CHANGED:
+            continue
+        update_start = time.perf_counter()
+        tft_manager.update()
+        update_durations.append(time.perf_counter() - update_start)
+        display_power.wait_idle()
+        wake_up_durations.append(display_power.states[-1][0] - start)
+        apply_durations.append(display_power.last_apply_duration)
+    tft_manager.close()
+
+    return {
+        "runs": len(wake_up_durations),
+        "update_max_ms": max(update_durations) * 1000,
+        "apply_mean_ms": statistics.mean(apply_durations) * 1000,
+        "wake_up_mean_ms": statistics.mean(wake_up_durations) * 1000,
+        "wake_up_max_ms": max(wake_up_durations) * 1000,
+    }
+
+
+def benchmark_cold_start(runs: int) -> Dict[str, float]:
+    """ Starts fresh processes creating the frontend, and measures the process start and the frontend creation """
+    process_durations = []
+    init_durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, __file__, "--cold-start-child"], check=True, capture_output=True,
+                                text=True).stdout
+        process_durations.append(time.perf_counter() - start)
+        init_durations.append(json.loads(output.strip().splitlines()[-1])["frontend_init"])
+
+    return {
+        "runs": runs,
+        "frontend_init_median_ms": statistics.median(init_durations) * 1000,
+        "process_median_ms": statistics.median(process_durations) * 1000,
+    }
+
+
+def run_cold_start_child():
+    """ Creates the frontend and prints how long it took; run in a fresh process by benchmark_cold_start() """
+    # The benchmark machine may not have the panel locale
+    config.DEBUG_MODE = True
+    config.LOCALE = ""
+    Device.pin_factory = MockFactory()
+    import main
+
+    # The status cache and history files are created in a temporary directory, not over the real ones
+    with tempfile.TemporaryDirectory() as directory:
+        config.STATUS_CACHE_FILE = os.path.join(directory, "status_cache.json")
+        config.STATUS_HISTORY_FILE = os.path.join(directory, "status_history.bin")
+
+        start = time.perf_counter()
+        main.Frontend()
+        print(json.dumps({"frontend_init": time.perf_counter() - start}))
+
+
+def benchmark_memory_growth(frame_count: int) -> Dict[str, float]:
+    """
+    Long simulated run of the main screen, with status changes and taps, measuring the memory allocated by Python and
+    the process memory that are not released between the start and the end of the run
+    """
+    warm_up_frame_count = frame_count // 10
+
+    def on_frame(frame: int, screen: MainScreen):
+        if frame % 10 == 0:
+            pygame.event.post(pygame.event.Event(BOX_STATUS_CHANGED, status=create_status(frame // 10)))
+        if frame % 50 == 0:
+            position = HOUSE_MODE_BUTTON_POSITIONS[frame // 50 % len(HOUSE_MODE_BUTTON_POSITIONS)]
+            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=position, button=1, touch=True))
+            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=position, button=1, touch=True))
+
+        # Memory use is measured once the caches are filled
+        if frame == warm_up_frame_count:
+            measures["start_traced"] = tracemalloc.get_traced_memory()[0]
+            measures["start_resident"] = get_memory_usage()
+
+    measures = {}
+    tracemalloc.start()
+    try:
+        run_main_screen(frame_count, on_frame)
+        end_traced = tracemalloc.get_traced_memory()[0]
+        end_resident = get_memory_usage()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "frames": frame_count - warm_up_frame_count,
+        "traced_growth_kib": (end_traced - measures["start_traced"]) / 1024,
+        "resident_growth_kib": (end_resident - measures["start_resident"]) / 1024
+        if end_resident is not None and measures["start_resident"] is not None else 0.0,
+    }
+
+
+def get_commit() -> str:
+    """ Returns the short hash of the current commit, or "unknown" outside of a git repository """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_results(results: Dict, baseline: Dict) -> List[Tuple[str, str, float, float]]:
+    """ Returns the metrics present in both results, as (scenario, metric, baseline value, value) """
+    comparison = []
+    for scenario, metrics in results["scenarios"].items():
+        for metric, value in metrics.items():
+            baseline_value = baseline["scenarios"].get(scenario, {}).get(metric)
+            if baseline_value is not None:
+                comparison.append((scenario, metric, baseline_value, value))
+    return comparison
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Runs the headless benchmarks and writes the results to a JSON file")
+    parser.add_argument("--scenario", action="append", help="Scenario to run (all by default), may be repeated")
+    parser.add_argument("--frames", type=int, default=1000, help="Number of frames of the main screen scenarios")
+    parser.add_argument("--duration", type=float, default=5, help="Duration of the communicator scenarios, in seconds")
+    parser.add_argument("--output", help="Results file, benchmark-<commit>.json by default")
+    parser.add_argument("--compare", help="Results file of a previous run to compare the results with")
+    parser.add_argument("--cold-start-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        run_cold_start_child()
+        sys.exit(0)
+
+    # The failing scenarios would log every failure
+    logging.basicConfig(level=logging.ERROR)
+    setup_headless()
+
+    scenarios = {
+        "idle": lambda: benchmark_idle(args.frames),
+        "changing-status": lambda: benchmark_changing_status(args.frames),
+        "touch-storm": lambda: benchmark_touch_storm(args.frames),
+        "slow-communicator": lambda: benchmark_slow_communicator(args.duration, delay=0.2, interval=0.05),
+        "failing-communicator": lambda: benchmark_failing_communicator(args.duration, interval=0.05),
+        "display-wake-up": lambda: benchmark_display_wake_up(runs=20, delay=0.05),
+        "cold-start": lambda: benchmark_cold_start(runs=5),
+        "memory-growth": lambda: benchmark_memory_growth(args.frames * 10),
+    }
+    unknown_scenarios = set(args.scenario or []) - set(scenarios)
+    if unknown_scenarios:
+        parser.error(f"Unknown scenarios {', '.join(sorted(unknown_scenarios))}, "
+                     f"choose among {', '.join(scenarios)}")
+
+    commit = get_commit()
+    results = {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "scenarios": {},
+    }
+    for name, benchmark in scenarios.items():
+        if args.scenario and name not in args.scenario:
+            continue
+        print(f"Running {name}...", flush=True)
+        results["scenarios"][name] = benchmark()
+        for metric, value in results["scenarios"][name].items():
+            print(f"  {metric}: {value:.3f}" if isinstance(value, float) else f"  {metric}: {value}")
+
+    output_path = args.output if args.output is not None else f"benchmark-{commit}.json"
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output_path}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as file:
+            baseline_results = json.load(file)
+        print(f"Compared with {baseline_results['commit']}:")
+        for scenario, metric, baseline_value, value in compare_results(results, baseline_results):
+            change = f"{(value - baseline_value) / baseline_value * 100:+.1f}%" if baseline_value else "n/a"
+            print(f"  {scenario} {metric}: {baseline_value:.3f} -> {value:.3f} ({change})")
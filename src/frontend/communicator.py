@@ -1,13 +1,27 @@
+from __future__ import annotations
 import config
+import pygame
 import threading
 import abc
 import enum
-from typing import Union, List
+from typing import Union, List, Optional, Callable, Tuple, TYPE_CHECKING
 import dataclasses
+import time
 import logging
 
+if TYPE_CHECKING:
+    from status_cache import StatusCache
+    from status_history import StatusHistory
+    from refresh_scheduler import RefreshScheduler
+
 LOGGER = logging.getLogger(__name__)
 
+# PyGame event posted when the status of the home automation box changes. The event has the following attributes:
+# - status: the new BoxStatus
+# - changed_fields: the names of the BoxStatus fields that changed
+# - generation: the status generation number (see Communicator.generation)
+BOX_STATUS_CHANGED = pygame.event.custom_type()
+
 
 class HouseMode(enum.Enum):
     AWAY = "away"
@@ -22,64 +36,407 @@ class BoxStatus:
     doors_opened: List[str]
     outside_temperature: Union[float, None]
     house_mode: Union[HouseMode, None]
+    # Time (as returned by time.time()) at which the status was produced by its source; not part of the status values
+    timestamp: Union[float, None] = dataclasses.field(default=None, compare=False)
+    # Time (as returned by time.monotonic()) at which the panel received the notification of the status change, for the
+    # statuses pushed by the home automation box; not part of the status values
+    received_time: Union[float, None] = dataclasses.field(default=None, compare=False)
+    # True if the values are the last known ones but could not be confirmed recently; the timestamp is then the time
+    # at which they were last confirmed
+    is_stale: bool = False
+    # True if the house mode is the one requested by the user but was not yet confirmed by the home automation box
+    is_house_mode_pending: bool = False
+    # Names of the sources that could not be read, when the status is merged from several sources; the values of the
+    # other sources are still valid
+    unavailable_sources: List[str] = dataclasses.field(default_factory=list)
 
 
 class BoxInterface(abc.ABC):
+    @property
+    def refresh_interval(self) -> Optional[float]:
+        """ Returns the status polling interval suited to this interface, or None for the default interval """
+        return None
+
+    def set_status_listener(self, listener: Optional[Callable[[], None]]):
+        """
+        Sets the function called when the interface is notified that the status changed, for interfaces receiving
+        notifications from the home automation box. The listener may be called from any thread.
+        """
+        pass
+
     def read_status(self) -> BoxStatus:
-        """ Reads the status of the home automation box """
+        """
+        Reads the status of the home automation box.
+
+        The returned status must not be modified: implementations may return the previous status object again when
+        the status did not change.
+        """
         pass
 
-    def write_house_mode(self, mode: HouseMode):
-        """ writes the house mode of the home automation box """
+    def write_house_mode(self, mode: HouseMode) -> bool:
+        """
+        writes the house mode of the home automation box
+
+        returns: True if the house mode was written; otherwise, False.
+        """
         pass
 
 
-class Communicator:
-    def __init__(self, box: BoxInterface):
+class BaseCommunicator(abc.ABC):
+    """ Keeps the status of the home automation box up to date; subclasses implement the background engine """
+
+    def __init__(self, box: BoxInterface, status_cache: Optional[StatusCache] = None,
+                 scheduler: Optional[RefreshScheduler] = None, status_history: Optional[StatusHistory] = None):
         self.__box = box
+        self.__box.set_status_listener(self._on_status_notified)
+        self.__status_cache = status_cache
+        self.__status_history = status_history
+
+        # Status read scheduling, by default with the polling interval suited to the box interface
+        if scheduler is None:
+            from refresh_scheduler import create_refresh_scheduler
+            interval = box.refresh_interval if box.refresh_interval is not None else config.NORMAL_REFRESH_INTERVAL
+            scheduler = create_refresh_scheduler(interval)
+        self.__scheduler = scheduler
 
-        self.__thread = None
-        self.__loop_event = threading.Event()
-        self.__exit_requested = False
         self.__mode_to_set = None
+        self.__mode_request_time = 0.0
         self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__is_suspended = False
         self.__current_status = BoxStatus(is_valid=False,
                                           lights_on=[],
                                           doors_opened=[],
                                           outside_temperature=None,
                                           house_mode=None)
 
+        # Start with the last known status, so that something is displayed until the first refresh completes
+        if self.__status_cache is not None:
+            cached_status = self.__status_cache.load()
+            if cached_status is not None:
+                LOGGER.info(f"Using the cached status of the home automation box from {cached_status.timestamp}")
+                self.__current_status = cached_status
+
+        # Time at which the current status was last confirmed by the home automation box
+        self.__status_time = self.__current_status.timestamp
+
+        # Optimistic house mode: the requested mode is displayed until a status read confirms or contradicts it.
+        # Writes and reads are counted so that only reads started after the requested mode was written can
+        # contradict it.
+        self.__box_house_mode = self.__current_status.house_mode
+        self.__pending_house_mode: Optional[HouseMode] = None
+        self.__pending_house_mode_write: Optional[int] = None
+        self.__write_count = 0
+        self.__read_write_count = 0
+
     @property
     def current_status(self) -> BoxStatus:
         """ Returns the current status of the home automation box """
         with self.__lock:
             return self.__current_status
 
+    @property
+    def generation(self) -> int:
+        """ Returns a number incremented each time the status of the home automation box changes """
+        with self.__lock:
+            return self.__generation
+
+    @property
+    def status_history(self) -> Optional[StatusHistory]:
+        """ Returns the history of the status values read from the home automation box, if any """
+        return self.__status_history
+
     def set_house_mode(self, mode: HouseMode):
-        """ Sets the house mode on the home automation box """
+        """
+        Sets the house mode on the home automation box.
+
+        The mode is applied to the current status right away, marked as pending, and written in the background once
+        no other mode was requested for HOUSE_MODE_WRITE_DELAY seconds.
+        """
         LOGGER.debug(f"Setting house mode to {mode}")
         with self.__lock:
             self.__mode_to_set = mode
-        self.__loop_event.set()
+            self.__mode_request_time = time.monotonic()
+            self.__pending_house_mode = mode
+            self.__pending_house_mode_write = None
+
+            notification = None
+            if self.__current_status.is_valid:
+                notification = self.__set_current_status(dataclasses.replace(self.__current_status,
+                                                                             house_mode=mode,
+                                                                             is_house_mode_pending=True))
+        if notification is not None:
+            self.__notify(*notification)
+        self._on_house_mode_requested()
 
     def refresh(self):
         """ Refreshes the status of the home automation box """
+        self._on_status_read(self._read_status())
 
+    @abc.abstractmethod
+    def start(self):
+        """ Starts the home automation box background management """
+        pass
+
+    @abc.abstractmethod
+    def stop(self):
+        """ Stops the home automation box background management """
+        pass
+
+    def suspend(self):
+        """
+        Slows the status reads of the running background management down to one every STATUS_HISTORY_SAMPLE_INTERVAL
+        seconds, while the status is not displayed, so that the status history keeps being recorded. start() resumes
+        the reads at their normal pace.
+        """
+        LOGGER.info("Suspending the home automation box background management")
+        with self.__lock:
+            self.__is_suspended = True
+
+    def _take_suspended(self) -> bool:
+        """
+        Leaves the suspended mode
+
+        returns: True if the communicator was suspended; otherwise, False.
+        """
+        with self.__lock:
+            is_suspended = self.__is_suspended
+            self.__is_suspended = False
+            return is_suspended
+
+    def _on_house_mode_requested(self):
+        """ Called when a new house mode must be written to the home automation box """
+        pass
+
+    def _on_status_notified(self):
+        """ Called from any thread when the home automation box notifies that its status changed """
+        pass
+
+    @property
+    def _scheduler(self) -> RefreshScheduler:
+        """ Returns the scheduler deciding when the status is read """
+        return self.__scheduler
+
+    def _get_next_refresh_delay(self) -> float:
+        """ Returns the delay in seconds before the next status read, longer while the communicator is suspended """
+        delay = self.__scheduler.get_next_delay()
+        with self.__lock:
+            if self.__is_suspended:
+                delay = max(delay, config.STATUS_HISTORY_SAMPLE_INTERVAL)
+        return delay
+
+    def _read_status(self) -> BoxStatus:
+        """ Reads the status from the home automation box; may be called from any thread, one read at a time """
         LOGGER.debug('Refreshing home automation box values...')
-        new_status = self.__box.read_status()
         with self.__lock:
-            self.__current_status = new_status
+            self.__read_write_count = self.__write_count
+        return self.__box.read_status()
+
+    def _on_status_read(self, new_status: BoxStatus):
+        """ Processes a status read from the home automation box """
+        if self.__status_history is not None and new_status.is_valid and not new_status.is_stale:
+            self.__status_history.record(new_status)
+        changed = self._apply_status(new_status)
+        if new_status.is_valid:
+            self.__scheduler.on_read_success(changed)
+        else:
+            self.__scheduler.on_read_failure()
+
+    def _apply_status(self, new_status: BoxStatus) -> bool:
+        """
+        Sets a status as the current status and notifies the changes.
+
+        returns: True if the status values changed; otherwise, False.
+        """
+        with self.__lock:
+            if new_status.is_valid and not new_status.is_stale:
+                self.__status_time = time.time()
+                self.__box_house_mode = new_status.house_mode
+                new_status = self.__reconcile_house_mode(new_status)
+            elif self.__current_status.is_valid:
+                # Keep the last known values when the box cannot be read, but mark them as stale
+                new_status = self.__get_stale_status()
+
+            notification = self.__set_current_status(new_status)
+
+        if notification is None:
+            return False
+        self.__notify(*notification)
+        return True
+
+    def __reconcile_house_mode(self, new_status: BoxStatus) -> BoxStatus:
+        """ Returns the status read, with the house mode still pending if any; must be called with the lock held """
+        if self.__pending_house_mode is None:
+            return new_status
+
+        # The pending mode is confirmed by the box, or contradicted by a read started after it was written
+        written = self.__pending_house_mode_write is not None \
+            and self.__read_write_count >= self.__pending_house_mode_write
+        if new_status.house_mode == self.__pending_house_mode or written:
+            if new_status.house_mode != self.__pending_house_mode:
+                LOGGER.warning(f"House mode {self.__pending_house_mode} not applied by the home automation box")
+            self.__pending_house_mode = None
+            self.__pending_house_mode_write = None
+            return new_status
+
+        return dataclasses.replace(new_status, house_mode=self.__pending_house_mode, is_house_mode_pending=True)
+
+    def __set_current_status(self, new_status: BoxStatus) -> Optional[Tuple[BoxStatus, List[str], int]]:
+        """
+        Sets the current status; must be called with the lock held.
+
+        returns: the arguments of __notify if the status values changed; otherwise, None.
+        """
+        # Box interfaces return the same object when the status did not change
+        if new_status is self.__current_status:
+            return None
+
+        changed_fields = [field.name for field in dataclasses.fields(BoxStatus)
+                          if field.compare
+                          and getattr(new_status, field.name) != getattr(self.__current_status, field.name)]
+        self.__current_status = new_status
+        if not changed_fields:
+            return None
+
+        self.__generation += 1
+        return new_status, changed_fields, self.__generation
+
+    def __notify(self, new_status: BoxStatus, changed_fields: List[str], generation: int):
+        """ Persists the new status values and notifies the user interface """
+        if new_status.is_valid and not new_status.is_stale and not new_status.is_house_mode_pending:
+            self._save_status()
+
+        LOGGER.debug(f"Home automation box status changed (generation {generation}): {', '.join(changed_fields)}")
+        if pygame.display.get_init():
+            pygame.event.post(pygame.event.Event(BOX_STATUS_CHANGED,
+                                                 status=new_status,
+                                                 changed_fields=changed_fields,
+                                                 generation=generation))
+
+    def _check_staleness(self):
+        """ Marks the current status as stale if it was not confirmed for more than STATUS_STALE_AGE seconds """
+        with self.__lock:
+            status_time = self.__status_time
+            is_outdated = status_time is None or time.time() - status_time > config.STATUS_STALE_AGE
+            if not self.__current_status.is_valid or self.__current_status.is_stale or not is_outdated:
+                return
+            stale_status = self.__get_stale_status()
+        self._apply_status(stale_status)
+
+    def _save_status(self):
+        """ Saves the current status to the status cache, with the time it was last confirmed """
+        if self.__status_cache is None:
+            return
+
+        with self.__lock:
+            status = self.__current_status
+            status_time = self.__status_time
+            box_house_mode = self.__box_house_mode
+        if status.is_valid:
+            # Only the values confirmed by the box are persisted
+            self.__status_cache.save(dataclasses.replace(status,
+                                                         house_mode=box_house_mode,
+                                                         is_house_mode_pending=False,
+                                                         timestamp=status_time))
+
+    def __get_stale_status(self) -> BoxStatus:
+        """ Returns the current status marked as stale; must be called with the lock held """
+        if self.__current_status.is_stale:
+            return self.__current_status
+        return dataclasses.replace(self.__current_status, is_stale=True, timestamp=self.__status_time)
+
+    def _get_house_mode_write_delay(self) -> Optional[float]:
+        """
+        Returns the delay in seconds before the requested house mode must be written, to coalesce rapid requests, or
+        None if no house mode was requested
+        """
+        with self.__lock:
+            if self.__mode_to_set is None:
+                return None
+            elapsed = time.monotonic() - self.__mode_request_time
+            return max(0.0, config.HOUSE_MODE_WRITE_DELAY - elapsed)
+
+    def _take_house_mode_request(self) -> Optional[HouseMode]:
+        """
+        Returns the house mode to write to the home automation box, if any and if no other mode was requested for
+        HOUSE_MODE_WRITE_DELAY seconds, and clears the request
+        """
+        with self.__lock:
+            if time.monotonic() - self.__mode_request_time < config.HOUSE_MODE_WRITE_DELAY:
+                return None
+            mode = self.__mode_to_set
+            self.__mode_to_set = None
+            return mode
+
+    def _write_house_mode(self, mode: HouseMode) -> bool:
+        """
+        Writes the house mode to the home automation box; may be called from any thread
+
+        returns: True if the house mode was written; otherwise, False.
+        """
+        LOGGER.info(f"Calling home automation box to set house mode to {mode}")
+        try:
+            return self.__box.write_house_mode(mode)
+        except Exception as err:
+            LOGGER.error(f"Failed to write the house mode to the home automation box: {err}")
+            return False
+
+    def _on_house_mode_written(self, mode: HouseMode, success: bool):
+        """ Processes the result of a house mode write; rolls the displayed mode back if the write failed """
+        notification = None
+        with self.__lock:
+            self.__write_count += 1
+            if mode == self.__pending_house_mode and self.__mode_to_set is None:
+                if success:
+                    self.__pending_house_mode_write = self.__write_count
+                else:
+                    LOGGER.warning(f"Failed to set house mode to {mode}, restoring {self.__box_house_mode}")
+                    self.__pending_house_mode = None
+                    self.__pending_house_mode_write = None
+                    if self.__current_status.is_valid:
+                        notification = self.__set_current_status(
+                            dataclasses.replace(self.__current_status,
+                                                house_mode=self.__box_house_mode,
+                                                is_house_mode_pending=False))
+
+        if notification is not None:
+            self.__notify(*notification)
+        self.__scheduler.on_house_mode_written()
+
+
+class Communicator(BaseCommunicator):
+    """ Manages the home automation box communications from a background thread """
+
+    def __init__(self, box: BoxInterface, status_cache: Optional[StatusCache] = None,
+                 scheduler: Optional[RefreshScheduler] = None, status_history: Optional[StatusHistory] = None):
+        super().__init__(box, status_cache, scheduler, status_history)
+
+        self.__thread = None
+        self.__loop_event = threading.Event()
+        self.__exit_event: Optional[threading.Event] = None
+        self.__lock = threading.Lock()
 
     def start(self):
-        """ Starts the home automation box background management """
+        """ Starts the home automation box background management; the status is refreshed in the background """
+
+        with self.__lock:
+            is_running = self.__exit_event is not None
+        if self._take_suspended() and is_running:
+            # The thread is still running: read the status right away
+            LOGGER.info("Resuming the home automation box background management")
+            self._check_staleness()
+            self.__loop_event.set()
+            return
 
         LOGGER.info("Starting the home automation box background management")
 
+        # Each thread gets its own exit event so that a thread still stopping cannot be revived
+        exit_event = threading.Event()
         with self.__lock:
-            self.__exit_requested = False
+            self.__exit_event = exit_event
 
-        self.refresh()
-        self.__thread = threading.Thread(target=self.__thread_main)
+        self._check_staleness()
+        self.__thread = threading.Thread(target=self.__thread_main, args=(exit_event,))
         self.__thread.daemon = True
         self.__thread.start()
 
@@ -88,40 +445,46 @@ class Communicator:
 
         LOGGER.info("Stopping the home automation box background management")
 
+        self._take_suspended()
         with self.__lock:
-            self.__exit_requested = True
+            if self.__exit_event is not None:
+                self.__exit_event.set()
+                self.__exit_event = None
 
         self.__loop_event.set()
 
-    def __thread_main(self):
+    def _on_house_mode_requested(self):
+        self.__loop_event.set()
+
+    def _on_status_notified(self):
+        self.__loop_event.set()
+
+    def __thread_main(self, exit_event: threading.Event):
         """ Implements the main loop of the background management thread """
-        fast_refresh_counter = 0
         self.__loop_event.set()
 
         while True:
             try:
-                # Wait for the loop event and reset it if required
-                wait_time = 1 if fast_refresh_counter > 0 else config.NORMAL_REFRESH_INTERVAL
-                LOGGER.debug(f"Next refresh in {wait_time} seconds (fast refresh count = {fast_refresh_counter})")
+                # Wait for the loop event and reset it if required; a requested house mode is written once no other
+                # mode was requested for a while
+                wait_time = self._get_house_mode_write_delay()
+                if wait_time is None:
+                    wait_time = self._get_next_refresh_delay()
+                    LOGGER.debug(f"Next refresh in {wait_time:.1f} seconds")
                 if self.__loop_event.wait(wait_time):
                     self.__loop_event.clear()
 
-                # Decrement the refresh counter
-                if fast_refresh_counter > 0:
-                    fast_refresh_counter -= 1
-
                 # check exit condition and set mode requests
-                local_mode_to_set = None
-                with self.__lock:
-                    if self.__exit_requested:
-                        return
-                    local_mode_to_set = self.__mode_to_set
-                    self.__mode_to_set = None
+                if exit_event.is_set():
+                    self._save_status()
+                    return
 
+                local_mode_to_set = self._take_house_mode_request()
                 if local_mode_to_set is not None:
-                    LOGGER.info(f"Calling home automation box to set house mode to {local_mode_to_set}")
-                    self.__box.write_house_mode(local_mode_to_set)
-                    fast_refresh_counter = config.AFTER_ACTION_FAST_REFRESH_DURATION
+                    success = self._write_house_mode(local_mode_to_set)
+                    self._on_house_mode_written(local_mode_to_set, success)
+                elif self._get_house_mode_write_delay() is not None:
+                    continue
 
                 # Refresh
                 self.refresh()
@@ -11,17 +11,131 @@ PIN_BACKLIGHT = 18
 SCREEN_TIMEOUT = 30
 SCREEN_DISPLAY = ":0"
 
-# Data refresh interval
+# Presence and display power service (src/pir/pirscreenmanager.py) owning the PIR sensor, the backlight and the display
+# power: the frontend only follows the screen state it publishes on its Unix socket, and reconnects every
+# PRESENCE_RECONNECT_DELAY seconds while it is unreachable (the screen then stays ON). Empty to drive the GPIO pins
+# directly from the frontend instead, only when the service is not installed.
+PRESENCE_SOCKET = "/run/pirscreen.sock"
+PRESENCE_RECONNECT_DELAY = 1
+
+# Display output: "window" (SDL window, on the SCREEN_DISPLAY X display on the panel) or "framebuffer" (RGB565
+# frames written straight to the FRAMEBUFFER_DEVICE framebuffer, without X)
+DISPLAY_OUTPUT = "window"
+FRAMEBUFFER_DEVICE = "/dev/fb1"
+
+# Display power control, applied from a worker thread: "x-dpms" (DPMS of the SCREEN_DISPLAY X display), "sysfs"
+# (backlight power file at BACKLIGHT_SYSFS_PATH), "fake" (nothing is done, always used in debug mode) or "none".
+# "x-dpms" needs the "window" display output: with the "framebuffer" output, "sysfs" is used instead
+DISPLAY_POWER_BACKEND = "x-dpms"
+BACKLIGHT_SYSFS_PATH = "/sys/class/backlight/rpi_backlight/bl_power"
+
+# Frame rate: full rate while something is animating or being touched, otherwise the main loop sleeps until an event
+# arrives (status change, PIR, touch) or the screen has a scheduled change, e.g. the clock minute
+FRAME_RATE = 30
+ACTIVE_FRAME_RATE_DURATION = 0.5
+
+# User interface assets precompiled by "python asset_bundle.py" (empty to load the asset files one by one). The bundle
+# is not compared with the asset files at startup: it must be rebuilt after modifying them ("--check" to compare)
+ASSET_BUNDLE_FILE = "assets/bundle.bin"
+
+# Frame time profiling: when enabled, the duration of each phase of the main loop is recorded for the last
+# FRAME_PROFILER_SIZE frames, and the statistics are logged every FRAME_PROFILER_DUMP_INTERVAL seconds (0 to disable)
+# and when the process receives SIGUSR1. As the signal is only handled once the main loop wakes up, the loop wakes up at
+# least every FRAME_PROFILER_SIGNAL_INTERVAL seconds while the profiler is enabled, even when the screen is OFF
+FRAME_PROFILER_ENABLED = False
+FRAME_PROFILER_SIZE = 1000
+FRAME_PROFILER_DUMP_INTERVAL = 0
+FRAME_PROFILER_SIGNAL_INTERVAL = 1
+
+# Data refresh scheduling: "adaptive" or "fixed" scheduler. Both read the status every NORMAL_REFRESH_INTERVAL
+# seconds, and every FAST_REFRESH_INTERVAL seconds for AFTER_ACTION_FAST_REFRESH_DURATION reads after a user action.
+# The adaptive scheduler also shortens the interval down to FAST_REFRESH_INTERVAL while the values change and
+# lengthens it by REFRESH_RELAX_FACTOR up to QUIET_REFRESH_INTERVAL while they don't. On failures, it backs off
+# exponentially up to ERROR_BACKOFF_MAX_INTERVAL (+/- ERROR_BACKOFF_JITTER ratio), and after
+# CIRCUIT_BREAKER_THRESHOLD consecutive failures only probes the box every CIRCUIT_BREAKER_OPEN_DURATION seconds
+REFRESH_SCHEDULER = "adaptive"
 NORMAL_REFRESH_INTERVAL = 5
+FAST_REFRESH_INTERVAL = 1
 AFTER_ACTION_FAST_REFRESH_DURATION = 10
+QUIET_REFRESH_INTERVAL = 15
+REFRESH_RELAX_FACTOR = 1.5
+ERROR_BACKOFF_MAX_INTERVAL = 60
+ERROR_BACKOFF_JITTER = 0.2
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_OPEN_DURATION = 120
+
+# Last known status of the home automation box, displayed at startup until the first refresh completes (empty to
+# disable), and age in seconds after which the status is displayed as stale until it is refreshed
+STATUS_CACHE_FILE = "status_cache.json"
+STATUS_STALE_AGE = 60
+
+# History of the status values, displayed as sparklines by the main screen: number of samples kept, minimum interval
+# in seconds between two samples (2880 samples every 60s cover 48 hours) and memory-mapped file in which the samples
+# are kept across restarts (empty to keep them in memory only). While the screen is OFF, the status is still read every
+# STATUS_HISTORY_SAMPLE_INTERVAL seconds to record the history
+STATUS_HISTORY_SIZE = 2880
+STATUS_HISTORY_SAMPLE_INTERVAL = 60
+STATUS_HISTORY_FILE = "status_history.bin"
+
+# House mode changes are displayed immediately and written to the home automation box once no other change was
+# requested for HOUSE_MODE_WRITE_DELAY seconds, so that rapid taps result in a single write
+HOUSE_MODE_WRITE_DELAY = 0.3
+
+# Home automation box communication engine: "thread" or "asyncio", and the maximum number of concurrent
+# calls to the home automation box with the asyncio engine
+COMMUNICATOR_ENGINE = "thread"
+ASYNC_MAX_CONCURRENT_CALLS = 2
 
 # Home automation box configuration
 HOME_AUTOMATION_BOX_URL = "http://10.10.10.29/script/?exec=info_display.php"
 
+# Additional zones read along with the home automation box (zone name -> URL of its info_display script). The sources
+# are read concurrently by up to AGGREGATE_MAX_WORKERS threads, and a source that does not answer within
+# AGGREGATE_SOURCE_TIMEOUT seconds is reported unavailable, with its last known values, instead of delaying the status
+# of the others. The zones are read on each refresh; with PUSH_ENABLED, the home automation box is only read when it
+# notifies a change or every PUSH_HEARTBEAT_INTERVAL seconds
+EXTRA_BOX_SOURCES = {}
+AGGREGATE_SOURCE_TIMEOUT = 3
+AGGREGATE_MAX_WORKERS = 4
+
+# HTTP requests to the home automation box: timeouts in seconds, retries of failed requests with an exponential
+# backoff (backoff factor * 2^retry seconds) and number of request latencies kept for statistics
+HTTP_CONNECT_TIMEOUT = 2
+HTTP_READ_TIMEOUT = 5
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF_FACTOR = 0.2
+HTTP_LATENCY_HISTORY_SIZE = 100
+
+# Status change notifications pushed by the home automation box (POST to http://<panel>:<port>/status). When
+# enabled, the status is still polled every PUSH_HEARTBEAT_INTERVAL seconds in case a notification is lost. The
+# listener only accepts the requests carrying PUSH_TOKEN in an "Authorization: Bearer <token>" header, and the token
+# must be set to enable the notifications. PUSH_LISTEN_HOST must be set to the panel address on the network of the home
+# automation box for it to reach the listener. The latency from the reception of each notification to the display of
+# the status is logged
+PUSH_ENABLED = False
+PUSH_LISTEN_HOST = "127.0.0.1"
+PUSH_LISTEN_PORT = 8081
+PUSH_TOKEN = ""
+PUSH_HEARTBEAT_INTERVAL = 60
+
 # User interface
 LOCALE = "fr_CH.utf8"
 
-# Logging
+# Logging pipeline: the records are queued by the logging threads and written by a background thread, in batches of up
+# to LOG_BATCH_SIZE records gathered for at most LOG_BATCH_INTERVAL seconds. Records logged from the same line more than
+# LOG_RATE_LIMIT times per LOG_RATE_LIMIT_PERIOD seconds are dropped, except errors. When LOG_QUEUE_ENABLED is False,
+# the handlers are called by the logging threads.
+# The DEBUG records of the LOG_MEMORY_LOGGERS loggers (e.g. ["communicator", "eedomus_box"]) are only kept in memory,
+# the last LOG_MEMORY_SIZE of them, and written when an error is logged or the process receives SIGUSR2; the other
+# records are written according to the levels of LOGGING_CONFIG. Empty to capture nothing.
+LOG_QUEUE_ENABLED = True
+LOG_BATCH_SIZE = 100
+LOG_BATCH_INTERVAL = 2
+LOG_MEMORY_LOGGERS = []
+LOG_MEMORY_SIZE = 1000
+LOG_RATE_LIMIT = 10
+LOG_RATE_LIMIT_PERIOD = 60
+
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -43,7 +157,7 @@ LOGGING_CONFIG = {
             'class': "logging.handlers.RotatingFileHandler",
             'formatter': 'standard',
             "filename": "app.log",
-            "maxBytes": 10000,
+            "maxBytes": 1000000,
             "backupCount": 10,
         },
     },
@@ -52,6 +166,15 @@ LOGGING_CONFIG = {
             'handlers': ['default', 'rotating_to_file'],
             'level': 'WARNING',
             'propagate': True
+        },
+        'frame_profiler': {
+            'level': 'INFO',
+        },
+        'log_writer': {
+            'level': 'INFO',
+        },
+        'push_box': {
+            'level': 'INFO',
         }
     }
 }
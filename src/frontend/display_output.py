@@ -0,0 +1,136 @@
+import config
+import pygame
+import abc
+import fcntl
+import mmap
+import os
+import stat
+import struct
+from typing import List, Tuple
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Linux framebuffer ioctls and the layout of the structures they fill: fb_var_screeninfo starts with xres, yres,
+# xres_virtual, yres_virtual, xoffset, yoffset, bits_per_pixel and grayscale, and the offset of line_length in
+# fb_fix_screeninfo depends on the size of the unsigned long smem_start field before it
+FBIOGET_VSCREENINFO = 0x4600
+FBIOGET_FSCREENINFO = 0x4602
+FB_VAR_SCREENINFO_SIZE = 160
+FB_VAR_SCREENINFO_HEADER = struct.Struct("=8I")
+FB_FIX_SCREENINFO_SIZE = 80
+FB_FIX_SCREENINFO_LINE_LENGTH_OFFSET = 40 + struct.calcsize("L")
+
+
+class DisplayOutput(abc.ABC):
+    """ Destination of the rendered frames: the frontend draws on the surface and then updates the changed regions """
+
+    @property
+    @abc.abstractmethod
+    def surface(self) -> pygame.Surface:
+        """ Returns the surface to draw the frames on """
+        pass
+
+    @abc.abstractmethod
+    def update(self, rects: List[pygame.Rect]):
+        """ Displays the regions of the surface that changed """
+        pass
+
+    def close(self):
+        """ Releases the output resources """
+        pass
+
+
+class WindowOutput(DisplayOutput):
+    """ Displays the frames in a window of the SDL video driver (the X display on the panel) """
+
+    def __init__(self, size: Tuple[int, int]):
+        pygame.display.set_caption('Domo panel')
+        self.__surface = pygame.display.set_mode(size)
+
+    @property
+    def surface(self) -> pygame.Surface:
+        return self.__surface
+
+    def update(self, rects: List[pygame.Rect]):
+        pygame.display.update(rects)
+
+
+class FramebufferOutput(DisplayOutput):
+    """
+    Writes the frames straight to a 16 bits per pixel (RGB565) Linux framebuffer device, without an X server.
+
+    The frames are drawn on an off-screen surface (the SDL dummy video driver must be used) and only the changed
+    regions are converted to RGB565 and copied to the memory-mapped framebuffer. A regular file can stand in for the
+    framebuffer device: it is then sized for the surface and read as a raw RGB565 image.
+    """
+
+    def __init__(self, size: Tuple[int, int], device: str = config.FRAMEBUFFER_DEVICE):
+        self.__surface = pygame.display.set_mode(size)
+
+        # The changed regions are converted to RGB565 in this surface before being copied to the framebuffer
+        self.__rgb565_surface = pygame.Surface(size, depth=16, masks=(0xF800, 0x07E0, 0x001F, 0))
+        self.__rgb565_pitch = self.__rgb565_surface.get_pitch()
+
+        self.__file = open(device, "r+b")
+        try:
+            if stat.S_ISREG(os.fstat(self.__file.fileno()).st_mode):
+                self.__line_length = size[0] * 2
+                if os.fstat(self.__file.fileno()).st_size < self.__line_length * size[1]:
+                    self.__file.truncate(self.__line_length * size[1])
+            else:
+                self.__line_length = self.__get_line_length(size)
+            self.__mmap = mmap.mmap(self.__file.fileno(), self.__line_length * size[1])
+        except Exception:
+            self.__file.close()
+            raise
+
+        LOGGER.info(f"Displaying the frames on the '{device}' framebuffer")
+
+    @property
+    def surface(self) -> pygame.Surface:
+        return self.__surface
+
+    def update(self, rects: List[pygame.Rect]):
+        rects = [rect.clip(self.__surface.get_rect()) for rect in rects]
+        for rect in rects:
+            self.__rgb565_surface.blit(self.__surface, rect, rect)
+
+        # The surface stays locked while its pixels are viewed
+        with memoryview(self.__rgb565_surface.get_view("1")).cast("B") as pixels:
+            for rect in rects:
+                row_length = rect.width * 2
+                for y in range(rect.top, rect.bottom):
+                    source = y * self.__rgb565_pitch + rect.left * 2
+                    destination = y * self.__line_length + rect.left * 2
+                    self.__mmap[destination:destination + row_length] = pixels[source:source + row_length]
+
+    def close(self):
+        self.__mmap.close()
+        self.__file.close()
+
+    def __get_line_length(self, size: Tuple[int, int]) -> int:
+        """ Checks the framebuffer geometry and returns the length of a line, in bytes """
+        var_info = bytearray(FB_VAR_SCREENINFO_SIZE)
+        fcntl.ioctl(self.__file.fileno(), FBIOGET_VSCREENINFO, var_info)
+        xres, yres, _, _, _, _, bits_per_pixel, _ = FB_VAR_SCREENINFO_HEADER.unpack_from(var_info)
+        if (xres, yres) != size or bits_per_pixel != 16:
+            raise ValueError(f"Unsupported framebuffer mode {xres}x{yres} {bits_per_pixel}bpp, "
+                             f"{size[0]}x{size[1]} 16bpp is required")
+
+        fix_info = bytearray(FB_FIX_SCREENINFO_SIZE)
+        fcntl.ioctl(self.__file.fileno(), FBIOGET_FSCREENINFO, fix_info)
+        line_length = struct.unpack_from("=I", fix_info, FB_FIX_SCREENINFO_LINE_LENGTH_OFFSET)[0]
+        return line_length if line_length >= size[0] * 2 else size[0] * 2
+
+
+def create_display_output(size: Tuple[int, int]) -> DisplayOutput:
+    """ Creates the display output selected in the configuration; must be called before pygame.init() """
+    if config.DISPLAY_OUTPUT == "framebuffer":
+        # Nothing is displayed by SDL: the dummy driver provides the off-screen surface
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.display.init()
+        return FramebufferOutput(size)
+
+    pygame.display.init()
+    return WindowOutput(size)
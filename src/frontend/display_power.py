@@ -0,0 +1,232 @@
+import config
+import abc
+import ctypes
+import ctypes.util
+import threading
+import time
+from typing import Optional, List, Tuple
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DisplayPowerBackend(abc.ABC):
+    """
+    Turns the display ON or OFF from a worker thread, so that the caller is never blocked.
+
+    Requests are coalesced: when several states are requested while the worker is busy, only the last one is applied.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__requested_state: Optional[bool] = None
+        self.__is_busy = False
+        self.__is_closed = False
+        self.__last_apply_duration: Optional[float] = None
+        self.__thread = threading.Thread(target=self.__thread_main, name=f"{type(self).__name__}")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    @property
+    def last_apply_duration(self) -> Optional[float]:
+        """ Returns the time in seconds the last power state change took on the worker thread """
+        with self.__condition:
+            return self.__last_apply_duration
+
+    def set_power(self, is_on: bool):
+        """ Requests the display to be turned ON or OFF, and returns immediately """
+        with self.__condition:
+            self.__requested_state = is_on
+            self.__condition.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until all the requested power states are applied.
+
+        returns: True if the requested states were applied; False if the timeout expired.
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__requested_state is None and not self.__is_busy, timeout)
+
+    def close(self):
+        """ Stops the worker thread once the pending request is applied, and releases the backend resources """
+        with self.__condition:
+            self.__is_closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+        self._on_close()
+
+    @abc.abstractmethod
+    def _apply(self, is_on: bool):
+        """ Turns the display ON or OFF; called from the worker thread """
+        pass
+
+    def _on_close(self):
+        """ Releases the backend resources; called once the worker thread has stopped """
+        pass
+
+    def __thread_main(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__requested_state is not None or self.__is_closed)
+                if self.__requested_state is None:
+                    return
+                is_on = self.__requested_state
+                self.__requested_state = None
+                self.__is_busy = True
+
+            start_time = time.monotonic()
+            try:
+                self._apply(is_on)
+            except Exception as err:
+                LOGGER.error(f"Failed to turn the display {'ON' if is_on else 'OFF'}: {err}")
+            duration = time.monotonic() - start_time
+            LOGGER.debug(f"Display turned {'ON' if is_on else 'OFF'} in {duration * 1000:.1f}ms")
+
+            with self.__condition:
+                self.__last_apply_duration = duration
+                self.__is_busy = False
+                self.__condition.notify_all()
+
+
+class XDpmsDisplayPowerBackend(DisplayPowerBackend):
+    """
+    Turns the display ON or OFF with the X DPMS extension, like "xset -dpms" and "xset dpms force off" do, through a
+    persistent connection to the X server instead of spawning processes.
+    """
+
+    DPMS_MODE_ON = 0
+    DPMS_MODE_OFF = 3
+
+    # X error handlers receive the display and the error event; the default one exits the process
+    __ERROR_HANDLER_TYPE = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+    # Error handlers installed by the backends, which stay installed, and therefore referenced, until the process exits
+    __installed_error_handlers = []
+
+    def __init__(self, display: str = config.SCREEN_DISPLAY):
+        self.__display_name = display
+        self.__display: Optional[int] = None
+
+        self.__x11 = ctypes.cdll.LoadLibrary(ctypes.util.find_library("X11") or "libX11.so.6")
+        self.__x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.__x11.XOpenDisplay.restype = ctypes.c_void_p
+        self.__x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.__x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.__x11.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        self.__x11.XSetErrorHandler.restype = ctypes.c_void_p
+
+        self.__xext = ctypes.cdll.LoadLibrary(ctypes.util.find_library("Xext") or "libXext.so.6")
+        self.__xext.DPMSCapable.argtypes = [ctypes.c_void_p]
+        self.__xext.DPMSEnable.argtypes = [ctypes.c_void_p]
+        self.__xext.DPMSDisable.argtypes = [ctypes.c_void_p]
+        self.__xext.DPMSForceLevel.argtypes = [ctypes.c_void_p, ctypes.c_ushort]
+
+        # The X error handler is process-wide: it is installed once, from the thread creating the backend rather than
+        # from the worker thread, and only handles the errors of the backend's own X connection. The errors of the other
+        # connections (e.g. SDL's) are passed on to the handler installed before
+        error_handler = self.__ERROR_HANDLER_TYPE(self.__on_x_error)
+        previous_handler = self.__x11.XSetErrorHandler(ctypes.cast(error_handler, ctypes.c_void_p))
+        self.__previous_error_handler = self.__ERROR_HANDLER_TYPE(previous_handler) if previous_handler else None
+        XDpmsDisplayPowerBackend.__installed_error_handlers.append(error_handler)
+
+        super().__init__()
+
+    def _apply(self, is_on: bool):
+        display = self.__get_display()
+        if is_on:
+            # Disabling DPMS turns the display ON and keeps the X server from turning it OFF
+            self.__xext.DPMSDisable(display)
+        else:
+            # The X server needs a moment after DPMS is enabled before it accepts a level, as xset does
+            self.__xext.DPMSEnable(display)
+            self.__x11.XSync(display, 0)
+            time.sleep(0.1)
+            self.__xext.DPMSForceLevel(display, self.DPMS_MODE_OFF)
+
+        # Wait for the requests to be processed, so that their errors are reported now
+        self.__x11.XSync(display, 0)
+
+    def _on_close(self):
+        if self.__display is not None:
+            self.__x11.XCloseDisplay(self.__display)
+            self.__display = None
+
+    def __get_display(self) -> int:
+        """ Returns the connection to the X server, connecting on first use """
+        if self.__display is None:
+            display = self.__x11.XOpenDisplay(self.__display_name.encode())
+            if not display:
+                raise ConnectionError(f"Cannot open X display '{self.__display_name}'")
+
+            # Set before the first request, so that its errors are handled as the backend's
+            self.__display = display
+            if not self.__xext.DPMSCapable(display):
+                self.__display = None
+                self.__x11.XCloseDisplay(display)
+                raise RuntimeError(f"X display '{self.__display_name}' does not support DPMS")
+            LOGGER.info(f"Connected to X display '{self.__display_name}' for display power management")
+        return self.__display
+
+    def __on_x_error(self, display: Optional[int], event: Optional[int]) -> int:
+        """ Handles the X errors of all the X connections of the process; called from the thread receiving the error """
+        if display is not None and display == self.__display:
+            LOGGER.error("X server error while changing the display power state")
+            return 0
+        if self.__previous_error_handler is not None:
+            return self.__previous_error_handler(display, event)
+        return 0
+
+
+class SysfsBacklightDisplayPowerBackend(DisplayPowerBackend):
+    """ Turns the display backlight ON or OFF through its sysfs bl_power file """
+
+    BL_POWER_ON = "0"
+    BL_POWER_OFF = "4"
+
+    def __init__(self, bl_power_path: str = config.BACKLIGHT_SYSFS_PATH):
+        self.__bl_power_path = bl_power_path
+        super().__init__()
+
+    def _apply(self, is_on: bool):
+        with open(self.__bl_power_path, "w") as file:
+            file.write(self.BL_POWER_ON if is_on else self.BL_POWER_OFF)
+
+
+class FakeDisplayPowerBackend(DisplayPowerBackend):
+    """ Records the display power states instead of applying them, optionally simulating a slow display """
+
+    def __init__(self, delay: float = 0):
+        self.__delay = delay
+        self.__lock = threading.Lock()
+        self.__states: List[Tuple[float, bool]] = []
+        super().__init__()
+
+    @property
+    def states(self) -> List[Tuple[float, bool]]:
+        """ Returns the applied power states, with the time.monotonic() at which they were applied """
+        with self.__lock:
+            return list(self.__states)
+
+    def _apply(self, is_on: bool):
+        if self.__delay > 0:
+            time.sleep(self.__delay)
+        with self.__lock:
+            self.__states.append((time.monotonic(), is_on))
+
+
+def create_display_power_backend() -> Optional[DisplayPowerBackend]:
+    """ Creates the display power backend selected in the configuration, or None if there is none """
+    if config.DISPLAY_POWER_BACKEND == "fake" or config.DEBUG_MODE:
+        return FakeDisplayPowerBackend()
+    if config.DISPLAY_POWER_BACKEND == "x-dpms":
+        if config.DISPLAY_OUTPUT == "framebuffer":
+            # There is no X server with the framebuffer output: the backlight is the only display power control
+            LOGGER.warning("The x-dpms display power backend needs X, using the sysfs backend with the framebuffer "
+                           "output")
+            return SysfsBacklightDisplayPowerBackend()
+        return XDpmsDisplayPowerBackend()
+    if config.DISPLAY_POWER_BACKEND == "sysfs":
+        return SysfsBacklightDisplayPowerBackend()
+    return None
+
@@ -1,5 +1,10 @@
 from communicator import BoxInterface, BoxStatus, HouseMode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict
 import requests
+import collections
+import time
 import logging
 import config
 
@@ -7,7 +12,8 @@ LOGGER = logging.getLogger(__name__)
 
 
 class EedomusBoxInterface(BoxInterface):
-    def __init__(self):
+    def __init__(self, url: str = config.HOME_AUTOMATION_BOX_URL):
+        self.__url = url
         self.__str_to_house_mode = {
             "present": HouseMode.PRESENT,
             "away": HouseMode.AWAY,
@@ -15,27 +21,104 @@ class EedomusBoxInterface(BoxInterface):
         }
         self.__house_mode_to_str = {v: k for k, v in self.__str_to_house_mode.items()}
 
+        # Keep-alive session with bounded retries, reused by all the requests to the box
+        retries = Retry(total=config.HTTP_RETRIES,
+                        backoff_factor=config.HTTP_RETRY_BACKOFF_FACTOR,
+                        status_forcelist=[500, 502, 503, 504],
+                        raise_on_status=False)
+        self.__session = requests.Session()
+        self.__session.mount("http://", HTTPAdapter(max_retries=retries, pool_connections=1, pool_maxsize=2))
+        self.__session.mount("https://", HTTPAdapter(max_retries=retries, pool_connections=1, pool_maxsize=2))
+
+        # Latencies of the last requests, in seconds
+        self.__latencies = collections.deque(maxlen=config.HTTP_LATENCY_HISTORY_SIZE)
+
+        # Last status read, with the raw response and the validators used to detect unchanged responses
+        self.__last_status: Optional[BoxStatus] = None
+        self.__last_content: Optional[bytes] = None
+        self.__last_etag: Optional[str] = None
+        self.__last_modified: Optional[str] = None
+        self.__unchanged_read_count = 0
+
+    @property
+    def unchanged_read_count(self) -> int:
+        """ Returns the number of status reads for which the status was unchanged and not decoded again """
+        return self.__unchanged_read_count
+
+    @property
+    def last_latency(self) -> Optional[float]:
+        """ Returns the duration in seconds of the last request to the box (including retries) """
+        return self.__latencies[-1] if self.__latencies else None
+
+    @property
+    def average_latency(self) -> Optional[float]:
+        """ Returns the average duration in seconds of the last requests to the box (including retries) """
+        return sum(self.__latencies) / len(self.__latencies) if self.__latencies else None
+
+    def parse_status(self, result: dict) -> BoxStatus:
+        """
+        Creates a status from the JSON data sent by the home automation box; the sources of additional zones may only
+        send some of the values
+        """
+        return BoxStatus(is_valid=True,
+                         lights_on=result.get("lights_on", []),
+                         doors_opened=result.get("doors_opened", []),
+                         house_mode=self.__str_to_house_mode.get(result.get("house_mode"), None),
+                         outside_temperature=result.get("outside_temperature"),
+                         timestamp=result.get("timestamp", time.time()))
+
     def read_status(self) -> BoxStatus:
         try:
-            result = requests.get(config.HOME_AUTOMATION_BOX_URL).json()
+            # Let the box answer "304 Not Modified" when it supports conditional requests
+            headers = {}
+            if self.__last_status is not None:
+                if self.__last_etag is not None:
+                    headers["If-None-Match"] = self.__last_etag
+                if self.__last_modified is not None:
+                    headers["If-Modified-Since"] = self.__last_modified
+
+            response = self.__get(self.__url, headers)
+
+            # Unchanged status: return the previous status object without decoding the response
+            if self.__last_status is not None:
+                if response.status_code == 304 or response.content == self.__last_content:
+                    self.__unchanged_read_count += 1
+                    return self.__last_status
 
-            status = BoxStatus(is_valid=True,
-                               lights_on=result["lights_on"],
-                               doors_opened=result["doors_opened"],
-                               house_mode=self.__str_to_house_mode.get(result["house_mode"], None),
-                               outside_temperature=result["outside_temperature"])
+            status = self.parse_status(response.json())
+
+            self.__last_status = status
+            self.__last_content = response.content
+            self.__last_etag = response.headers.get("ETag")
+            self.__last_modified = response.headers.get("Last-Modified")
             return status
         except Exception as err:
             LOGGER.error(f"Failed to read the status from the home automation box: {err}")
             return BoxStatus(is_valid=False, lights_on=[], doors_opened=[], house_mode=None, outside_temperature=None)
 
-    def write_house_mode(self, mode: HouseMode):
+    def write_house_mode(self, mode: HouseMode) -> bool:
+        api_mode = self.__house_mode_to_str.get(mode, None)
         try:
-            api_mode = self.__house_mode_to_str.get(mode, None)
+            if api_mode is None:
+                return False
 
-            if api_mode is not None:
-                url = f"{config.HOME_AUTOMATION_BOX_URL}&set_mode={api_mode}"
-                requests.get(url)
+            url = f"{self.__url}&set_mode={api_mode}"
+            self.__get(url)
+            return True
         except Exception as err:
             LOGGER.error(f"Failed to set the mode to '{api_mode}' on the home automation box: {err}")
+            return False
 
+    def __get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """ Sends a GET request to the box and records its latency """
+        start_time = time.monotonic()
+        try:
+            response = self.__session.get(url,
+                                          headers=headers,
+                                          timeout=(config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT))
+            response.raise_for_status()
+            return response
+        finally:
+            latency = time.monotonic() - start_time
+            self.__latencies.append(latency)
+            LOGGER.debug(f"Home automation box request completed in {latency * 1000:.1f}ms")
@@ -0,0 +1,96 @@
+from communicator import BoxInterface, BoxStatus, HouseMode
+from typing import Optional, List
+import threading
+import time
+
+
+class FakeBoxInterface(BoxInterface):
+    """
+    In-memory home automation box for development, benchmarks and tests of the communicator policies.
+
+    Reads and writes can be slowed down with a delay and made to fail, and the calls are counted.
+    """
+
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.__lock = threading.Lock()
+        self.__delay = delay
+        self.__fail = fail
+        self.__status = BoxStatus(is_valid=True,
+                                  lights_on=[],
+                                  doors_opened=[],
+                                  outside_temperature=12.5,
+                                  house_mode=HouseMode.PRESENT,
+                                  timestamp=time.time())
+        self.__read_count = 0
+        self.__write_count = 0
+        self.__written_modes: List[HouseMode] = []
+
+    @property
+    def read_count(self) -> int:
+        """ Returns the number of status reads """
+        with self.__lock:
+            return self.__read_count
+
+    @property
+    def write_count(self) -> int:
+        """ Returns the number of house mode writes """
+        with self.__lock:
+            return self.__write_count
+
+    @property
+    def written_modes(self) -> List[HouseMode]:
+        """ Returns the house modes written, in order """
+        with self.__lock:
+            return list(self.__written_modes)
+
+    def set_delay(self, delay: float):
+        """ Sets the duration of each read and write, in seconds """
+        with self.__lock:
+            self.__delay = delay
+
+    def set_fail(self, fail: bool):
+        """ Makes the reads and writes fail or succeed """
+        with self.__lock:
+            self.__fail = fail
+
+    def update_status(self, lights_on: Optional[List[str]] = None, doors_opened: Optional[List[str]] = None,
+                      outside_temperature: Optional[float] = None, house_mode: Optional[HouseMode] = None):
+        """ Changes the status values returned by the next reads """
+        with self.__lock:
+            status = self.__status
+            self.__status = BoxStatus(is_valid=True,
+                                      lights_on=lights_on if lights_on is not None else status.lights_on,
+                                      doors_opened=doors_opened if doors_opened is not None else status.doors_opened,
+                                      outside_temperature=outside_temperature if outside_temperature is not None
+                                      else status.outside_temperature,
+                                      house_mode=house_mode if house_mode is not None else status.house_mode,
+                                      timestamp=time.time())
+
+    def read_status(self) -> BoxStatus:
+        with self.__lock:
+            self.__read_count += 1
+            delay = self.__delay
+            fail = self.__fail
+            status = self.__status
+
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            return BoxStatus(is_valid=False, lights_on=[], doors_opened=[], house_mode=None, outside_temperature=None)
+        return status
+
+    def write_house_mode(self, mode: HouseMode) -> bool:
+        with self.__lock:
+            self.__write_count += 1
+            delay = self.__delay
+            fail = self.__fail
+
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            return False
+
+        with self.__lock:
+            self.__written_modes.append(mode)
+        self.update_status(house_mode=mode)
+        return True
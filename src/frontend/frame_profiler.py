@@ -0,0 +1,109 @@
+import config
+import array
+import bisect
+import time
+from typing import Dict, List, Sequence
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds; the last bucket holds the longer durations
+HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)
+
+
+class FrameProfiler:
+    """
+    Measures the time spent in each phase of the last frames.
+
+    A frame starts with start_frame(); each call to mark() then ends a phase, which lasted since the previous mark,
+    and end_frame() records the frame. The durations are kept in a fixed-size ring buffer, from which the statistics
+    are computed when they are requested. Frames started again before they ended are discarded.
+    """
+
+    def __init__(self, phases: Sequence[str], size: int = config.FRAME_PROFILER_SIZE):
+        self.__phases = list(phases)
+        self.__phase_indexes = {phase: index for index, phase in enumerate(self.__phases)}
+        self.__size = size
+
+        # One row of phase durations, in seconds, per frame
+        self.__durations = array.array("d", bytes(8 * size * len(self.__phases)))
+        self.__frame_count = 0
+        self.__current = array.array("d", bytes(8 * len(self.__phases)))
+        self.__last_mark_time = 0.0
+
+    @property
+    def frame_count(self) -> int:
+        """ Returns the number of frames recorded since the profiler was created """
+        return self.__frame_count
+
+    def start_frame(self):
+        """ Starts measuring a frame """
+        for index in range(len(self.__current)):
+            self.__current[index] = 0.0
+        self.__last_mark_time = time.perf_counter()
+
+    def mark(self, phase: str):
+        """ Ends a phase of the current frame; a phase may be marked several times in a frame """
+        now = time.perf_counter()
+        self.__current[self.__phase_indexes[phase]] += now - self.__last_mark_time
+        self.__last_mark_time = now
+
+    def end_frame(self):
+        """ Records the current frame """
+        offset = (self.__frame_count % self.__size) * len(self.__phases)
+        self.__durations[offset:offset + len(self.__phases)] = self.__current
+        self.__frame_count += 1
+
+    def get_statistics(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the statistics of the recorded frames, per phase and for the whole frames ("total"): the number of
+        frames, the mean, p50, p95, p99 and max durations in milliseconds, and the histogram of the durations
+        (see HISTOGRAM_BOUNDS).
+        """
+        frame_count = min(self.__frame_count, self.__size)
+        phase_count = len(self.__phases)
+
+        columns: Dict[str, List[float]] = {}
+        for index, phase in enumerate(self.__phases):
+            columns[phase] = [self.__durations[frame * phase_count + index] * 1000 for frame in range(frame_count)]
+        columns["total"] = [sum(values) for values in zip(*columns.values())] if frame_count > 0 else []
+
+        return {phase: self.__get_column_statistics(values) for phase, values in columns.items()}
+
+    def get_report(self) -> str:
+        """ Returns the statistics as text """
+        lines = [f"Frame times over the last {min(self.__frame_count, self.__size)} frames (ms):"]
+        buckets = " ".join(f"<{bound}" for bound in HISTOGRAM_BOUNDS) + f" >={HISTOGRAM_BOUNDS[-1]}"
+        for phase, statistics in self.get_statistics().items():
+            histogram = " ".join(str(count) for count in statistics["histogram"])
+            lines.append(f"  {phase:<14} mean {statistics['mean']:7.2f}  p50 {statistics['p50']:7.2f}  "
+                         f"p95 {statistics['p95']:7.2f}  p99 {statistics['p99']:7.2f}  max {statistics['max']:7.2f}  "
+                         f"histogram [{histogram}]")
+        lines.append(f"  histogram buckets: {buckets}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """ Logs the statistics """
+        LOGGER.info(self.get_report())
+
+    @staticmethod
+    def __get_column_statistics(values: List[float]) -> Dict:
+        if not values:
+            return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0,
+                    "histogram": [0] * (len(HISTOGRAM_BOUNDS) + 1)}
+
+        values = sorted(values)
+        histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for value in values:
+            histogram[bisect.bisect_right(HISTOGRAM_BOUNDS, value)] += 1
+
+        def percentile(ratio: float) -> float:
+            return values[min(len(values) - 1, int(ratio * len(values)))]
+
+        return {"count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": values[-1],
+                "histogram": histogram}
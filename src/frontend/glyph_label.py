@@ -0,0 +1,100 @@
+import pygame
+import pygame_gui.elements as elements
+from pygame_gui.core import ColourGradient
+from typing import Dict, Tuple, List, Optional
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class UIGlyphLabel(elements.UILabel):
+    """
+    Label composing its text from pre-rendered glyphs instead of laying the text out with the font each time it
+    changes. It is a drop-in replacement for UILabel, meant for labels with a small set of characters whose text
+    changes often (clock, date, temperature).
+
+    The glyphs are rendered once per font and colours and shared by all the labels. Only the texts made of the
+    pre-rendered characters, which are not kerned, are composed glyph by glyph: the other texts (e.g. month names)
+    are rendered as a whole and cached like a glyph, so that the label looks exactly like a UILabel. Gradients,
+    shadows and disabled labels are rendered by UILabel.
+    """
+
+    # Characters pre-rendered when a label is created, and composed without kerning
+    DEFAULT_CHARACTERS = "0123456789:-.,°C "
+
+    # Maximum number of glyphs and whole texts cached per font and colours
+    MAX_ATLAS_SIZE = 128
+
+    # Glyph surfaces shared by all the labels, per font, text colour and background colour
+    __glyph_atlases: Dict[Tuple[pygame.font.Font, Tuple[int, ...], Tuple[int, ...]], Dict[str, pygame.Surface]] = {}
+
+    def __init__(self, *args, characters: str = DEFAULT_CHARACTERS, **kwargs):
+        # UILabel renders the text from its constructor
+        self.__characters = characters
+        self.__glyphs_key: Optional[Tuple[pygame.font.Font, Tuple[int, ...], Tuple[int, ...]]] = None
+        self.__glyphs: Dict[str, pygame.Surface] = {}
+        self.__images: List[pygame.Surface] = []
+        self.__image_index = 0
+        super().__init__(*args, **kwargs)
+
+    def rebuild(self):
+        if isinstance(self.bg_colour, ColourGradient) or isinstance(self.text_colour, ColourGradient) \
+                or self.bg_colour.a != 255 or self.text_shadow or not self.is_enabled:
+            super().rebuild()
+            return
+
+        glyphs = self.__get_glyph_atlas()
+        if all(character in self.__characters for character in self.text):
+            text_glyphs = [glyphs.get(character) or self.__get_glyph(glyphs, character) for character in self.text]
+        else:
+            text_glyphs = [glyphs.get(self.text) or self.__get_glyph(glyphs, self.text)]
+        text_width = sum(glyph.get_width() for glyph in text_glyphs)
+
+        # Two opaque images are used in turn: the displayed image must change for the screen to redraw the label
+        if not self.__images or self.__images[0].get_size() != self.relative_rect.size:
+            self.__images = [self.__convert(pygame.Surface(self.relative_rect.size, depth=32)) for _ in range(2)]
+        self.__image_index = 1 - self.__image_index
+        image = self.__images[self.__image_index]
+
+        # Centered like UILabel
+        image.fill(self.bg_colour)
+        x = int(self.rect.width / 2) - text_width // 2
+        y = int(self.rect.height / 2) - self.font.get_height() // 2
+        blits = []
+        for glyph in text_glyphs:
+            blits.append((glyph, (x, y)))
+            x += glyph.get_width()
+        image.blits(blits, doreturn=False)
+
+        if self.get_image_clipping_rect() is None:
+            self.image = image
+        else:
+            self.set_image(image)
+
+    def __get_glyph_atlas(self) -> Dict[str, pygame.Surface]:
+        """ Returns the glyphs rendered with the label font and colours, pre-rendering them on first use """
+        key = (self.font, tuple(self.text_colour), tuple(self.bg_colour))
+        if key == self.__glyphs_key:
+            return self.__glyphs
+
+        glyphs = UIGlyphLabel.__glyph_atlases.setdefault(key, {})
+        for character in self.__characters:
+            if character not in glyphs:
+                self.__get_glyph(glyphs, character)
+        self.__glyphs_key = key
+        self.__glyphs = glyphs
+        return glyphs
+
+    def __get_glyph(self, glyphs: Dict[str, pygame.Surface], text: str) -> pygame.Surface:
+        """ Renders a character or a whole text and adds it to the glyphs, unless the glyphs are full """
+        glyph = self.__convert(self.font.render(text, True, self.text_colour, self.bg_colour))
+        if len(glyphs) < UIGlyphLabel.MAX_ATLAS_SIZE:
+            glyphs[text] = glyph
+        return glyph
+
+    @staticmethod
+    def __convert(surface: pygame.Surface) -> pygame.Surface:
+        """ Converts an opaque surface to the display format, when the display is set, so that it is blitted faster """
+        if pygame.display.get_surface() is not None:
+            return surface.convert()
+        return surface
@@ -0,0 +1,252 @@
+import config
+import atexit
+import collections
+import logging
+import logging.config
+import logging.handlers
+import queue
+import signal
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# Queued to make the writer thread write the records kept in memory
+DUMP_REQUEST = object()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops the records logged from the same line of code more than rate times per period seconds, so that a message
+    logged on a hot path cannot flood the logs. Errors are never dropped; the number of dropped records is appended to
+    the next record logged from the line.
+    """
+
+    def __init__(self, rate: int = config.LOG_RATE_LIMIT, period: float = config.LOG_RATE_LIMIT_PERIOD):
+        super().__init__()
+        self.__rate = rate
+        self.__period = period
+        self.__lock = threading.Lock()
+
+        # Start of the current period, number of records logged and dropped during it, per line of code
+        self.__counters: Dict[Tuple[str, int], List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+
+        now = time.monotonic()
+        with self.__lock:
+            counter = self.__counters.get((record.pathname, record.lineno))
+            if counter is None:
+                self.__counters[(record.pathname, record.lineno)] = [now, 1, 0]
+                return True
+
+            if now - counter[0] >= self.__period:
+                dropped_count = counter[2]
+                counter[:] = [now, 1, 0]
+            elif counter[1] < self.__rate:
+                dropped_count = 0
+                counter[1] += 1
+            else:
+                counter[2] += 1
+                return False
+
+        if dropped_count > 0:
+            record.msg = f"{record.msg} ({dropped_count} similar messages dropped)"
+        return True
+
+
+class TimedQueueHandler(logging.handlers.QueueHandler):
+    """ Queue handler measuring how long the main thread is blocked by the logging calls """
+
+    def __init__(self, log_queue: queue.SimpleQueue):
+        super().__init__(log_queue)
+        self.__main_thread_id = threading.main_thread().ident
+        self.__main_thread_count = 0
+        self.__main_thread_duration = 0.0
+        self.__main_thread_max_duration = 0.0
+
+    @property
+    def main_thread_statistics(self) -> Tuple[int, float, float]:
+        """ Returns the number of records logged by the main thread, and the total and max time it was blocked """
+        return self.__main_thread_count, self.__main_thread_duration, self.__main_thread_max_duration
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if threading.get_ident() != self.__main_thread_id:
+            return super().handle(record)
+
+        start = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            duration = time.perf_counter() - start
+            self.__main_thread_count += 1
+            self.__main_thread_duration += duration
+            self.__main_thread_max_duration = max(self.__main_thread_max_duration, duration)
+
+
+class LogWriter:
+    """
+    Writes the queued log records to the handlers from a background thread, so that the logging threads never wait
+    for the console or the SD card.
+
+    The records are written in batches of up to batch_size records, gathered for at most batch_interval seconds, and
+    the handlers are flushed once per batch. memory_levels maps the names of the loggers whose records are captured
+    in memory to the level from which their records are written: the last memory_size records below that level are
+    only kept in memory, and written when an error is logged or when a dump is requested.
+    """
+
+    def __init__(self, handlers: List[logging.Handler], batch_size: int = config.LOG_BATCH_SIZE,
+                 batch_interval: float = config.LOG_BATCH_INTERVAL, memory_size: int = config.LOG_MEMORY_SIZE,
+                 memory_levels: Optional[Dict[str, int]] = None):
+        self.__handlers = handlers
+        self.__batch_size = batch_size
+        self.__batch_interval = batch_interval
+        self.__memory: Deque[logging.LogRecord] = collections.deque(maxlen=memory_size)
+        self.__memory_levels = memory_levels if memory_levels is not None else {}
+
+        # SimpleQueue.put() may be called from a signal handler
+        self.__queue = queue.SimpleQueue()
+        self.__thread = threading.Thread(target=self.__thread_main, name="LogWriter", daemon=True)
+        self.__thread.start()
+
+    @property
+    def queue(self) -> queue.SimpleQueue:
+        """ Returns the queue of the records to write """
+        return self.__queue
+
+    def request_dump(self):
+        """ Makes the writer thread write the records kept in memory; may be called from a signal handler """
+        self.__queue.put(DUMP_REQUEST)
+
+    def close(self):
+        """ Writes the queued records, stops the writer thread and closes the handlers """
+        self.__queue.put(None)
+        self.__thread.join()
+        for handler in self.__handlers:
+            handler.close()
+
+    def __thread_main(self):
+        while True:
+            # Gather a batch from the first record, without waiting when an error or a dump must be written
+            item = self.__queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.__batch_interval
+            while len(batch) < self.__batch_size and item is not None and item is not DUMP_REQUEST \
+                    and item.levelno < logging.ERROR:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.__queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            self.__write_batch(batch)
+            if batch[-1] is None:
+                return
+
+    def __write_batch(self, batch: List):
+        for item in batch:
+            if item is None:
+                continue
+            if item is DUMP_REQUEST:
+                self.__write_memory("dump requested")
+                continue
+
+            if item.levelno >= logging.ERROR:
+                self.__write_memory("error logged")
+            if item.levelno < self.__get_memory_level(item.name):
+                self.__memory.append(item)
+                continue
+            for handler in self.__handlers:
+                if item.levelno >= handler.level:
+                    self.__write(handler, item)
+
+        for handler in self.__handlers:
+            handler.flush()
+
+    def __write_memory(self, reason: str):
+        """ Writes the records kept in memory """
+        records = list(self.__memory)
+        self.__memory.clear()
+        for handler in self.__handlers:
+            handler_records = [record for record in records if record.levelno >= handler.level]
+            if not handler_records:
+                continue
+
+            self.__write(handler, logging.makeLogRecord({
+                "name": __name__, "module": "log_writer", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"{reason}, {len(handler_records)} recent records kept in memory follow"}))
+            for record in handler_records:
+                self.__write(handler, record)
+
+    def __get_memory_level(self, logger_name: str) -> int:
+        """ Returns the level below which the records of a logger are only kept in memory """
+        name = logger_name
+        while name not in self.__memory_levels:
+            if "." not in name:
+                return logging.NOTSET
+            name = name.rsplit(".", 1)[0]
+        return self.__memory_levels[name]
+
+    @staticmethod
+    def __write(handler: logging.Handler, record: logging.LogRecord):
+        """ Writes a record to a handler; streams are written without being flushed """
+        if not isinstance(handler, logging.StreamHandler) or handler.stream is None:
+            handler.handle(record)
+            return
+
+        handler.acquire()
+        try:
+            if not handler.filter(record):
+                return
+            if isinstance(handler, logging.handlers.RotatingFileHandler) and handler.shouldRollover(record):
+                handler.doRollover()
+            handler.stream.write(handler.format(record) + handler.terminator)
+        except Exception:
+            handler.handleError(record)
+        finally:
+            handler.release()
+
+
+def setup_logging(logging_config: Dict = config.LOGGING_CONFIG):
+    """
+    Configures the logging. When LOG_QUEUE_ENABLED is set, the handlers of the root logger are moved to a LogWriter
+    and replaced by a rate limited queue handler, and the LOG_MEMORY_LOGGERS loggers are lowered to DEBUG, their
+    records below the configured level being only kept in memory; SIGUSR2 then makes the writer write them.
+    """
+    logging.config.dictConfig(logging_config)
+    if not config.LOG_QUEUE_ENABLED:
+        return
+
+    memory_levels = {}
+    for name in config.LOG_MEMORY_LOGGERS:
+        logger = logging.getLogger(name)
+        memory_levels[name] = logger.getEffectiveLevel()
+        logger.setLevel(logging.DEBUG)
+
+    root = logging.getLogger()
+    writer = LogWriter(list(root.handlers), memory_levels=memory_levels)
+    queue_handler = TimedQueueHandler(writer.queue)
+    queue_handler.addFilter(RateLimitFilter())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    signal.signal(signal.SIGUSR2, lambda signum, frame: writer.request_dump())
+    atexit.register(shutdown_logging, queue_handler, writer)
+
+
+def shutdown_logging(queue_handler: TimedQueueHandler, writer: LogWriter):
+    """ Logs how long the main thread was blocked by the logging calls and writes the queued records """
+    count, duration, max_duration = queue_handler.main_thread_statistics
+    if count > 0:
+        LOGGER.info(f"{count} records logged by the main thread, blocked {duration * 1000:.1f}ms in total, "
+                    f"{duration / count * 1000000:.0f}us on average and {max_duration * 1000:.2f}ms at most")
+
+    logging.getLogger().removeHandler(queue_handler)
+    writer.close()
@@ -1,25 +1,42 @@
 import pygame
+import signal
 import sys
+import time
 import locale
 import logging
-import logging.config
-from typing import Optional
+from typing import Optional, List
 import config
 from screen import Screen
 from main_screen import MainScreen
-from communicator import Communicator
+from communicator import BaseCommunicator, Communicator, BoxInterface, BoxStatus, BOX_STATUS_CHANGED
+from async_communicator import AsyncCommunicator
 from eedomus_box import EedomusBoxInterface
-from tft_manager import TftManager
+from push_box import PushBoxInterface
+from aggregate_box import AggregateBoxInterface
+from status_cache import StatusCache
+from status_history import StatusHistory
+from tft_manager import TftManager, SCREEN_STATE_CHANGED
+from display_output import create_display_output
+from frame_profiler import FrameProfiler
+from log_writer import setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Events generated by the user, that must not be handled while the screen is OFF
+INPUT_EVENT_TYPES = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEWHEEL,
+                     pygame.FINGERMOTION, pygame.FINGERDOWN, pygame.FINGERUP, pygame.KEYDOWN, pygame.KEYUP)
+
+# Phases of a frame measured by the frame profiler
+FRAME_PHASES = ("tft", "events", "screen_loop", "ui_update", "draw", "screen_switch", "display_update")
 
 
 class Frontend:
     def __init__(self):
-        # Initialize PyGame
+        # Initialize the display output and PyGame
+        self.__output = create_display_output((320, 240))
         pygame.init()
         self.__clock = pygame.time.Clock()
-
-        pygame.display.set_caption('Domo panel')
-        self.__window_surface: pygame.Surface = pygame.display.set_mode((320, 240))
+        self.__window_surface: pygame.Surface = self.__output.surface
 
         # Configure the locale
         if config.LOCALE != "":
@@ -27,33 +44,99 @@ class Frontend:
 
         # Setup the screen management & home automation box communication
         self.__tft_manager = TftManager()
-        self.__communicator = Communicator(EedomusBoxInterface())
+        eedomus_box = EedomusBoxInterface()
+        box: BoxInterface = eedomus_box
+        self.__push_box: Optional[PushBoxInterface] = None
+        if config.PUSH_ENABLED:
+            self.__push_box = PushBoxInterface(eedomus_box, parse_status=eedomus_box.parse_status)
+            box = self.__push_box
+        self.__aggregate_box: Optional[AggregateBoxInterface] = None
+        if config.EXTRA_BOX_SOURCES:
+            sources = {"box": box}
+            sources.update({name: EedomusBoxInterface(url) for name, url in config.EXTRA_BOX_SOURCES.items()})
+            self.__aggregate_box = AggregateBoxInterface(sources)
+            box = self.__aggregate_box
+        status_cache = StatusCache(config.STATUS_CACHE_FILE) if config.STATUS_CACHE_FILE != "" else None
+        history_file = config.STATUS_HISTORY_FILE if config.STATUS_HISTORY_FILE != "" else None
+        self.__status_history = StatusHistory(file_path=history_file)
+        if config.COMMUNICATOR_ENGINE == "asyncio":
+            self.__communicator: BaseCommunicator = AsyncCommunicator(box, status_cache,
+                                                                      status_history=self.__status_history)
+        else:
+            self.__communicator: BaseCommunicator = Communicator(box, status_cache,
+                                                                 status_history=self.__status_history)
 
         # Setup the initial screen
         self.__screen: Optional[Screen] = MainScreen(surface=self.__window_surface,
                                                      communicator=self.__communicator)
         self.__screen.activate(None)
 
+        # Setup the frame profiler, whose statistics are logged on SIGUSR1 or periodically
+        self.__profiler: Optional[FrameProfiler] = None
+        self.__profiler_dump_requested = False
+        if config.FRAME_PROFILER_ENABLED:
+            self.__profiler = FrameProfiler(FRAME_PHASES)
+            signal.signal(signal.SIGUSR1, self.__on_profiler_dump_signal)
+
     def run(self):
         """ Executes the PyGame main loop """
 
         is_running = True
+        active_until = 0
+        profiler = self.__profiler
+        next_profiler_dump = time.monotonic() + config.FRAME_PROFILER_DUMP_INTERVAL
         while is_running:
-            time_delta = self.__clock.tick(30) / 1000.0
-
-            # Enable/Disable the screen
-            tft_state_changed = self.__tft_manager.update()
-
-            # Start the communicator when the screen goes ON, and stop it when the screen goes OFF
+            # Wait for the next frame: at full frame rate while active, otherwise sleep until something happens
+            if time.monotonic() < active_until:
+                time_delta = self.__clock.tick(config.FRAME_RATE) / 1000.0
+                events = pygame.event.get()
+            else:
+                # Python signal handlers do not run while the loop waits: wake up regularly to handle SIGUSR1
+                max_wait = None
+                if profiler is not None:
+                    max_wait = config.FRAME_PROFILER_SIGNAL_INTERVAL
+                    if 0 < config.FRAME_PROFILER_DUMP_INTERVAL:
+                        max_wait = min(max_wait, next_profiler_dump - time.monotonic())
+                events = self.__wait_for_events(max_wait)
+                time_delta = self.__clock.tick() / 1000.0
+
+            # The frame is measured from the end of the wait; frames where nothing is drawn are not recorded
+            if profiler is not None:
+                if self.__profiler_dump_requested or \
+                        (0 < config.FRAME_PROFILER_DUMP_INTERVAL and next_profiler_dump <= time.monotonic()):
+                    self.__profiler_dump_requested = False
+                    next_profiler_dump = time.monotonic() + config.FRAME_PROFILER_DUMP_INTERVAL
+                    profiler.dump()
+                profiler.start_frame()
+
+            # Enable/Disable the screen when the PIR sensor, the screen timeout or the forced mode asks for it
+            tft_state_changed = False
+            if any(event.type == SCREEN_STATE_CHANGED for event in events):
+                tft_state_changed = self.__tft_manager.update()
+
+            # Start the communicator when the screen goes ON, and only slow its reads down when the screen goes OFF so
+            # that the status history is still recorded
             if tft_state_changed:
                 if self.__tft_manager.is_on:
                     self.__communicator.start()
+
+                    # Redraw the whole screen with the last known status when waking up
+                    if self.__screen is not None:
+                        self.__screen.invalidate()
                 else:
-                    self.__communicator.stop()
+                    self.__communicator.suspend()
+            if profiler is not None:
+                profiler.mark("tft")
+
+            # While the screen is OFF, nothing is drawn and the loop sleeps until the screen is turned ON again
+            is_suspended = self.__tft_manager.is_on is False
 
             # Handles events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+            displayed_status: Optional[BoxStatus] = None
+            for event in events:
+                if event.type == BOX_STATUS_CHANGED:
+                    displayed_status = event.status
+                elif event.type == pygame.QUIT:
                     is_running = False
                     break
                 elif event.type == pygame.KEYDOWN:
@@ -67,29 +150,88 @@ class Frontend:
                     elif event.key == pygame.K_d:
                         self.__tft_manager.set_forced_mode(False)
 
-                if self.__screen is not None:
+                # Input events are ignored while the screen is OFF
+                if self.__screen is not None and not (is_suspended and event.type in INPUT_EVENT_TYPES):
                     self.__screen.handle_event(event)
+            if profiler is not None:
+                profiler.mark("events")
+
+            if is_suspended:
+                active_until = 0
+                continue
 
             # Handles screen
             if self.__screen is not None:
-                next_screen = self.__screen.run(time_delta)
+                next_screen = self.__screen.run(time_delta, profiler)
                 if next_screen is not None:
                     self.__screen.deactivate()
                     next_screen.activate(self.__screen)
                     self.__screen = next_screen
-
-            # Update the PyGame display
-            pygame.display.update()
+                    active_until = time.monotonic() + config.ACTIVE_FRAME_RATE_DURATION
+                    if profiler is not None:
+                        profiler.mark("screen_switch")
+
+            # Update only the regions of the display that were redrawn
+            if self.__screen is not None and self.__screen.dirty_rects:
+                self.__output.update(self.__screen.dirty_rects)
+
+                # Measure the latency from the reception of the status change notification to its display
+                if displayed_status is not None and self.__push_box is not None:
+                    self.__push_box.record_display(displayed_status)
+            if profiler is not None:
+                profiler.mark("display_update")
+                profiler.end_frame()
+
+            # Stay at full frame rate while the user interacts or the screen is animating
+            is_animating = self.__screen is not None and len(self.__screen.dirty_rects) > 0
+            if events or is_animating or any(pygame.mouse.get_pressed()):
+                active_until = time.monotonic() + config.ACTIVE_FRAME_RATE_DURATION
 
         # Cleanup on exit
         self.__screen.deactivate()
         self.__communicator.stop()
+        if self.__aggregate_box is not None:
+            self.__aggregate_box.close()
+        if self.__push_box is not None:
+            self.__push_box.close()
+        self.__status_history.close()
+        self.__tft_manager.close()
+        self.__output.close()
+
+    def __on_profiler_dump_signal(self, signum, frame):
+        """
+        Requests the frame profiler statistics to be logged; the handler runs, and the statistics are logged, once the
+        main loop wakes up
+        """
+        self.__profiler_dump_requested = True
+
+    def __wait_for_events(self, max_wait: Optional[float] = None) -> List[pygame.event.Event]:
+        """
+        Blocks until an event arrives, the screen has a scheduled change or max_wait seconds elapsed, and returns the
+        pending events
+        """
+
+        # While the screen is OFF, nothing is scheduled: only an event (e.g. the PIR sensor) wakes the loop up
+        wait_time = max_wait
+        if self.__tft_manager.is_on is not False and self.__screen is not None:
+            next_update_delay = self.__screen.get_next_update_delay()
+            if next_update_delay is not None:
+                wait_time = next_update_delay if wait_time is None else min(wait_time, next_update_delay)
+
+        if wait_time is None:
+            event = pygame.event.wait()
+        else:
+            event = pygame.event.wait(max(1, int(wait_time * 1000)))
+
+        if event.type == pygame.NOEVENT:
+            return pygame.event.get()
+        return [event] + pygame.event.get()
 
 
 if __name__ == "__main__":
     try:
         # Configure the logging
-        logging.config.dictConfig(config.LOGGING_CONFIG)
+        setup_logging()
 
         # Run the frontend
         frontend = Frontend()
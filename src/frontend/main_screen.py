@@ -1,67 +1,156 @@
+from __future__ import annotations
 import pygame
 from pygame import Rect
 import pygame_gui
 import pygame_gui.elements as elements
+from pygame_gui.core import UIContainer
+from glyph_label import UIGlyphLabel
+import resources
 from screen import Screen
-from communicator import Communicator, HouseMode
-from typing import Union, Type
+from sparkline import Sparkline
+from communicator import BaseCommunicator, HouseMode, BoxStatus, BOX_STATUS_CHANGED
+from typing import Union, Type, Optional
 from datetime import datetime
+import dataclasses
+import time
+
+# Duration in seconds of the outside temperature history displayed by the sparkline
+TEMPERATURE_SPARKLINE_DURATION = 24 * 60 * 60
+
+
+@dataclasses.dataclass(frozen=True)
+class MainScreenView:
+    """ Values displayed by the main screen """
+    time_text: str
+    day_text: str
+    month_text: str
+    year_text: str
+    temperature_text: str
+    lights_on_count: int
+    doors_opened_count: int
+    house_mode: Optional[HouseMode]
+    stale_text: str
+
+    @staticmethod
+    def create(status: BoxStatus, now: datetime) -> MainScreenView:
+        """ Creates the displayed values from a home automation box status and the current time """
+        return MainScreenView(time_text=now.strftime("%H:%M"),
+                              day_text=now.strftime("%d"),
+                              month_text=now.strftime("%b"),
+                              year_text=now.strftime("%Y"),
+                              temperature_text=f"{status.outside_temperature}°C",
+                              lights_on_count=len(status.lights_on),
+                              doors_opened_count=len(status.doors_opened),
+                              house_mode=status.house_mode,
+                              stale_text=MainScreenView.__get_stale_text(status, now))
+
+    @staticmethod
+    def __get_stale_text(status: BoxStatus, now: datetime) -> str:
+        """
+        Returns the text telling how old the displayed values are, or which sources could not be read, or an empty
+        text if they are up to date
+        """
+        if not status.is_stale:
+            if status.unavailable_sources:
+                return f"Indisponible : {', '.join(status.unavailable_sources)}"
+            return ""
+        if status.timestamp is None:
+            return "Données non actualisées"
+
+        age_minutes = max(0, int((now.timestamp() - status.timestamp) // 60))
+        if age_minutes < 60:
+            return f"Données d'il y a {age_minutes} min"
+        return f"Données d'il y a {age_minutes // 60} h"
 
 
 class MainScreen(Screen):
-    def __init__(self, surface: pygame.Surface, communicator: Communicator):
+    def __init__(self, surface: pygame.Surface, communicator: BaseCommunicator):
         super().__init__(surface)
         self.__communicator = communicator
 
-    def _on_create_controls(self, manager: pygame_gui.UIManager):
+        # Last received status, last displayed values and widget update statistics
+        self.__status = communicator.current_status
+        self.__view: Optional[MainScreenView] = None
+        self.__widget_updates = 0
+        self.__skipped_widget_updates = 0
+
+    @property
+    def widget_updates(self) -> int:
+        """ Returns the number of widget updates performed because the displayed value changed """
+        return self.__widget_updates
+
+    @property
+    def skipped_widget_updates(self) -> int:
+        """ Returns the number of widget updates skipped because the displayed value did not change """
+        return self.__skipped_widget_updates
+
+    def _on_create_controls(self, manager: pygame_gui.UIManager, container: UIContainer):
         # panels
         elements.UIPanel(relative_rect=Rect((0, 0), (320, 60)),
                          starting_layer_height=1,
-                         manager=manager)
+                         manager=manager,
+                         container=container)
         # elements.UIPanel(relative_rect=Rect((0, 70), (110, 170)),
         #                  starting_layer_height=1,
         #                  manager=manager)
         elements.UIPanel(relative_rect=Rect((120, 70), (200, 170)),
                          starting_layer_height=1,
-                         manager=manager)
+                         manager=manager,
+                         container=container)
 
         # Top labels
-        self.__time_label = elements.UILabel(relative_rect=Rect((5, 5), (115, 50)),
-                                             text="-",
-                                             manager=manager,
-                                             object_id="@time-label")
+        self.__time_label = UIGlyphLabel(relative_rect=Rect((5, 5), (115, 50)),
+                                         text="-",
+                                         manager=manager,
+                                         container=container,
+                                         object_id="@time-label")
         self.__date_labels = [
-            elements.UILabel(relative_rect=Rect((130, 6), (60, 16)),
-                             text="-",
-                             manager=manager,
-                             object_id="@date-label"),
-            elements.UILabel(relative_rect=Rect((130, 22), (60, 16)),
-                             text="-",
-                             manager=manager,
-                             object_id="@date-label"),
-            elements.UILabel(relative_rect=Rect((130, 38), (60, 16)),
-                             text="-",
-                             manager=manager,
-                             object_id="@date-label")
+            UIGlyphLabel(relative_rect=Rect((130, 6), (60, 16)),
+                         text="-",
+                         manager=manager,
+                         container=container,
+                         object_id="@date-label"),
+            UIGlyphLabel(relative_rect=Rect((130, 22), (60, 16)),
+                         text="-",
+                         manager=manager,
+                         container=container,
+                         object_id="@date-label"),
+            UIGlyphLabel(relative_rect=Rect((130, 38), (60, 16)),
+                         text="-",
+                         manager=manager,
+                         container=container,
+                         object_id="@date-label")
         ]
 
-        self.__temp_label = elements.UILabel(relative_rect=Rect((195, 5), (120, 50)),
-                                             text="°C",
-                                             manager=manager,
-                                             object_id="@temp-label")
+        self.__temp_label = UIGlyphLabel(relative_rect=Rect((195, 5), (120, 50)),
+                                         text="°C",
+                                         manager=manager,
+                                         container=container,
+                                         object_id="@temp-label")
+
+        # Stale values warning
+        self.__stale_label = elements.UILabel(relative_rect=Rect((125, 72), (190, 16)),
+                                              text="-",
+                                              manager=manager,
+                                              container=container,
+                                              object_id="@stale-label")
+        self.__stale_label.visible = False
 
         # Mode buttons
         self.__present_button = elements.UIButton(relative_rect=Rect((0, 70), (110, 50)),
                                                   text='Présent',
                                                   manager=manager,
+                                                  container=container,
                                                   object_id="@button_present")
         self.__away_button = elements.UIButton(relative_rect=Rect((0, 130), (110, 50)),
                                                text='Absent',
                                                manager=manager,
+                                               container=container,
                                                object_id="@button_away")
         self.__cleaning_button = elements.UIButton(relative_rect=Rect((0, 190), (110, 50)),
                                                    text='Ménage',
                                                    manager=manager,
+                                                   container=container,
                                                    object_id="@button_cleaning")
 
         # Status for doors and lights
@@ -71,19 +160,23 @@ class MainScreen(Screen):
         self.__lights_label_ok = elements.UILabel(relative_rect=Rect((130, 160), (85, 30)),
                                                   text="-",
                                                   manager=manager,
+                                                  container=container,
                                                   object_id="@status-label-ok")
         self.__lights_label_warning = elements.UILabel(relative_rect=Rect((130, 160), (85, 30)),
                                                        text="-",
                                                        manager=manager,
+                                                       container=container,
                                                        object_id="@status-label-warning")
         self.__lights_label_error = elements.UILabel(relative_rect=Rect((130, 160), (85, 30)),
                                                      text="-",
                                                      manager=manager,
+                                                     container=container,
                                                      object_id="@status-label-error")
 
         self.__doors_label_ok = elements.UILabel(relative_rect=Rect((225, 160), (85, 30)),
                                                  text="-",
                                                  manager=manager,
+                                                 container=container,
                                                  object_id="@status-label-ok")
         # self.__doors_label_warning = elements.UILabel(relative_rect=Rect((225, 160), (85, 30)),
         #                                               text="-",
@@ -92,85 +185,158 @@ class MainScreen(Screen):
         self.__doors_label_error = elements.UILabel(relative_rect=Rect((225, 160), (85, 30)),
                                                     text="-",
                                                     manager=manager,
+                                                    container=container,
                                                     object_id="@status-label-error")
 
         # Current mode label
         self.__mode_label_present = elements.UILabel(relative_rect=Rect((125, 205), (190, 30)),
                                                      text="Présent",
                                                      manager=manager,
+                                                     container=container,
                                                      object_id="@mode-label-present")
         self.__mode_label_away = elements.UILabel(relative_rect=Rect((125, 205), (190, 30)),
                                                   text="Absent",
                                                   manager=manager,
+                                                  container=container,
                                                   object_id="@mode-label-away")
         self.__mode_label_cleaning = elements.UILabel(relative_rect=Rect((125, 205), (190, 30)),
                                                       text="Ménage",
                                                       manager=manager,
+                                                      container=container,
                                                       object_id="@mode-label-cleaning")
 
         # images
-        self.__image_lights_ok = pygame.image.load("assets/images/lights-ok.png");
-        self.__image_lights_warning = pygame.image.load("assets/images/lights-warning.png");
-        self.__image_lights_error = pygame.image.load("assets/images/lights-error.png");
-        self.__image_doors_ok = pygame.image.load("assets/images/doors-ok.png");
-        # self.__image_doors_warning = pygame.image.load("assets/images/doors-warning.png");
-        self.__image_doors_error = pygame.image.load("assets/images/doors-error.png");
+        self.__image_lights_ok = resources.get_image("assets/images/lights-ok.png")
+        self.__image_lights_warning = resources.get_image("assets/images/lights-warning.png")
+        self.__image_lights_error = resources.get_image("assets/images/lights-error.png")
+        self.__image_doors_ok = resources.get_image("assets/images/doors-ok.png")
+        # self.__image_doors_warning = resources.get_image("assets/images/doors-warning.png")
+        self.__image_doors_error = resources.get_image("assets/images/doors-error.png")
+
+        # Currently displayed icons
+        self.__lights_image = self.__image_lights_ok
+        self.__doors_image = self.__image_doors_ok
+
+        # Outside temperature history, between the status labels and the mode label
+        self.__temperature_sparkline: Optional[Sparkline] = None
+        if self.__communicator.status_history is not None:
+            self.__temperature_sparkline = Sparkline(Rect((130, 190), (180, 14)),
+                                                     self.__communicator.status_history,
+                                                     "outside_temperature",
+                                                     TEMPERATURE_SPARKLINE_DURATION,
+                                                     pygame.Color("#c0c0c0"))
 
     def _on_activated(self, previous_screen: Union[Type[Screen], None]):
-        pass
+        # Force all the widgets to be updated on the next loop
+        self.__status = self.__communicator.current_status
+        self.__view = None
 
     def _on_deactivated(self):
         pass
 
     def _on_event(self, event: pygame.event.Event) -> Union[Type[Screen], None]:
-        if event.type == pygame.USEREVENT and event.user_type == pygame_gui.UI_BUTTON_PRESSED:
+        if event.type == BOX_STATUS_CHANGED:
+            self.__status = event.status
+        elif event.type == pygame.USEREVENT and event.user_type == pygame_gui.UI_BUTTON_PRESSED:
             if event.ui_element == self.__present_button:
                 self.__communicator.set_house_mode(HouseMode.PRESENT)
             elif event.ui_element == self.__away_button:
                 self.__communicator.set_house_mode(HouseMode.AWAY)
             elif event.ui_element == self.__cleaning_button:
                 self.__communicator.set_house_mode(HouseMode.CLEANING)
+
+            # The requested mode is applied to the current status right away: display it in this frame
+            self.__status = self.__communicator.current_status
         return None
 
+    def _on_get_next_update_delay(self) -> Optional[float]:
+        # Wake up at the next minute boundary for the clock, status changes arrive as events
+        now = datetime.now()
+        return 60 - now.second - now.microsecond / 1000000
+
     def _on_draw(self, surface: pygame.Surface):
         super()._on_draw(surface)
 
-        on_lights = len(self.__communicator.current_status.lights_on)
-        if on_lights == 0:
-            surface.blit(self.__image_lights_ok, self.__lights_icon_pos)
-        elif on_lights == 1:
-            surface.blit(self.__image_lights_warning, self.__lights_icon_pos)
-        else:
-            surface.blit(self.__image_lights_error, self.__lights_icon_pos)
-
-        open_doors = len(self.__communicator.current_status.doors_opened)
-        if open_doors == 0:
-            surface.blit(self.__image_doors_ok, self.__doors_icon_pos)
-        else:
-            surface.blit(self.__image_doors_error, self.__doors_icon_pos)
+        surface.blit(self.__lights_image, self.__lights_icon_pos)
+        surface.blit(self.__doors_image, self.__doors_icon_pos)
+        if self.__temperature_sparkline is not None:
+            surface.blit(self.__temperature_sparkline.surface, self.__temperature_sparkline.rect)
 
     def _on_loop(self):
-        self.__time_label.set_text(datetime.now().strftime("%H:%M"))
-        self.__date_labels[0].set_text(datetime.now().strftime("%d"))
-        self.__date_labels[1].set_text(datetime.now().strftime("%b"))
-        self.__date_labels[2].set_text(datetime.now().strftime("%Y"))
-        self.__temp_label.set_text(f"{self.__communicator.current_status.outside_temperature}°C")
-
-        on_lights = len(self.__communicator.current_status.lights_on)
-        self.__lights_label_ok.visible = on_lights == 0
-        self.__lights_label_ok.set_text(str(on_lights))
-        self.__lights_label_warning.visible = on_lights == 1
-        self.__lights_label_warning.set_text(str(on_lights))
-        self.__lights_label_error.visible = on_lights > 1
-        self.__lights_label_error.set_text(str(on_lights))
-
-        open_doors = len(self.__communicator.current_status.doors_opened)
-        self.__doors_label_ok.visible = open_doors == 0
-        self.__doors_label_ok.set_text(str(open_doors))
-        self.__doors_label_error.visible = open_doors != 0
-        self.__doors_label_error.set_text(str(open_doors))
-
-        mode = self.__communicator.current_status.house_mode
-        self.__mode_label_present.visible = mode == HouseMode.PRESENT
-        self.__mode_label_away.visible = mode == HouseMode.AWAY
-        self.__mode_label_cleaning.visible = mode == HouseMode.CLEANING
+        # Take a single snapshot of the time for the whole frame
+        view = MainScreenView.create(self.__status, datetime.now())
+        previous_view = self.__view
+        self.__view = view
+
+        # Only touch the widgets whose displayed value changed
+        if self.__has_changed(previous_view, view, "time_text", 1):
+            self.__time_label.set_text(view.time_text)
+        if self.__has_changed(previous_view, view, "day_text", 1):
+            self.__date_labels[0].set_text(view.day_text)
+        if self.__has_changed(previous_view, view, "month_text", 1):
+            self.__date_labels[1].set_text(view.month_text)
+        if self.__has_changed(previous_view, view, "year_text", 1):
+            self.__date_labels[2].set_text(view.year_text)
+        if self.__has_changed(previous_view, view, "temperature_text", 1):
+            self.__temp_label.set_text(view.temperature_text)
+
+        if self.__has_changed(previous_view, view, "lights_on_count", 4):
+            on_lights = view.lights_on_count
+            self.__lights_label_ok.visible = on_lights == 0
+            self.__lights_label_ok.set_text(str(on_lights))
+            self.__lights_label_warning.visible = on_lights == 1
+            self.__lights_label_warning.set_text(str(on_lights))
+            self.__lights_label_error.visible = on_lights > 1
+            self.__lights_label_error.set_text(str(on_lights))
+            if on_lights == 0:
+                self.__set_lights_image(self.__image_lights_ok)
+            elif on_lights == 1:
+                self.__set_lights_image(self.__image_lights_warning)
+            else:
+                self.__set_lights_image(self.__image_lights_error)
+
+        if self.__has_changed(previous_view, view, "doors_opened_count", 3):
+            open_doors = view.doors_opened_count
+            self.__doors_label_ok.visible = open_doors == 0
+            self.__doors_label_ok.set_text(str(open_doors))
+            self.__doors_label_error.visible = open_doors != 0
+            self.__doors_label_error.set_text(str(open_doors))
+            if open_doors == 0:
+                self.__set_doors_image(self.__image_doors_ok)
+            else:
+                self.__set_doors_image(self.__image_doors_error)
+
+        if self.__has_changed(previous_view, view, "stale_text", 1):
+            self.__stale_label.visible = view.stale_text != ""
+            self.__stale_label.set_text(view.stale_text)
+
+        if self.__has_changed(previous_view, view, "house_mode", 3):
+            mode = view.house_mode
+            self.__mode_label_present.visible = mode == HouseMode.PRESENT
+            self.__mode_label_away.visible = mode == HouseMode.AWAY
+            self.__mode_label_cleaning.visible = mode == HouseMode.CLEANING
+
+        if self.__temperature_sparkline is not None and self.__temperature_sparkline.update(time.time()):
+            self.invalidate(self.__temperature_sparkline.rect)
+
+    def __has_changed(self, previous_view: Optional[MainScreenView], view: MainScreenView, field: str,
+                      widget_count: int) -> bool:
+        """ Returns True if the field of the view changed and its widgets must be updated, and counts the updates """
+        if previous_view is not None and getattr(previous_view, field) == getattr(view, field):
+            self.__skipped_widget_updates += widget_count
+            return False
+
+        self.__widget_updates += widget_count
+        return True
+
+    def __set_lights_image(self, image: pygame.Surface):
+        if image is not self.__lights_image:
+            self.invalidate(Rect(self.__lights_icon_pos, self.__lights_image.get_size()))
+            self.__lights_image = image
+            self.invalidate(Rect(self.__lights_icon_pos, image.get_size()))
+
+    def __set_doors_image(self, image: pygame.Surface):
+        if image is not self.__doors_image:
+            self.invalidate(Rect(self.__doors_icon_pos, self.__doors_image.get_size()))
+            self.__doors_image = image
+            self.invalidate(Rect(self.__doors_icon_pos, image.get_size()))
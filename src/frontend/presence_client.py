@@ -0,0 +1,122 @@
+import config
+import json
+import socket
+import threading
+from typing import Callable, Optional
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PresenceClient:
+    """
+    Client of the presence and display power service (src/pir/pirscreenmanager.py), which owns the PIR sensor, the
+    backlight and the display power.
+
+    The service sends JSON lines over a Unix domain socket: {"event": "screen", "on": bool, "forced": bool or null}
+    when the screen is turned ON or OFF, and {"event": "presence", "motion": bool} when the PIR sensor starts or stops
+    detecting a motion; the current state is sent on connection. The client sends {"command": "force_screen",
+    "on": bool or null} to force the screen state. The events are received by a background thread, which reconnects
+    every PRESENCE_RECONNECT_DELAY seconds while the service is unreachable. The screen is reported ON while the service
+    is unreachable, as the service turns the backlight back on when it stops.
+    """
+
+    def __init__(self, socket_path: str, on_screen_state: Callable[[bool], None],
+                 on_presence: Optional[Callable[[bool], None]] = None):
+        self.__socket_path = socket_path
+        self.__on_screen_state = on_screen_state
+        self.__on_presence = on_presence
+
+        self.__lock = threading.Lock()
+        self.__socket: Optional[socket.socket] = None
+        self.__forced_is_on: Optional[bool] = None
+        # Last screen state reported to on_screen_state
+        self.__is_on: Optional[bool] = None
+        self.__exit_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__thread_main, name="PresenceClient", daemon=True)
+        self.__thread.start()
+
+    @property
+    def is_connected(self) -> bool:
+        """ Returns True if the client is connected to the service """
+        with self.__lock:
+            return self.__socket is not None
+
+    def set_forced_mode(self, is_on: Optional[bool]):
+        """ Asks the service to force the screen ON or OFF, or to follow the PIR sensor again when is_on is None """
+        with self.__lock:
+            self.__forced_is_on = is_on
+            if self.__socket is not None:
+                self.__send_forced_mode()
+
+    def close(self):
+        """ Disconnects from the service and stops the background thread """
+        self.__exit_event.set()
+        with self.__lock:
+            if self.__socket is not None:
+                # Unblocks the background thread
+                try:
+                    self.__socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.__thread.join()
+
+    def __send_forced_mode(self):
+        """ Sends the forced mode to the service; must be called with the lock held """
+        try:
+            self.__socket.sendall(json.dumps({"command": "force_screen", "on": self.__forced_is_on}).encode() + b"\n")
+        except OSError as err:
+            LOGGER.warning(f"Failed to send the forced screen mode to the presence service: {err}")
+
+    def __thread_main(self):
+        """ Connects to the service and handles its events until the client is closed """
+        while not self.__exit_event.is_set():
+            client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                client_socket.connect(self.__socket_path)
+            except OSError as err:
+                client_socket.close()
+                LOGGER.debug(f"Cannot connect to the presence service at '{self.__socket_path}': {err}")
+                self.__on_service_unreachable()
+                self.__exit_event.wait(config.PRESENCE_RECONNECT_DELAY)
+                continue
+
+            LOGGER.info(f"Connected to the presence service at '{self.__socket_path}'")
+            with self.__lock:
+                self.__socket = client_socket
+                if self.__forced_is_on is not None:
+                    self.__send_forced_mode()
+
+            try:
+                # The buffered reader returns each line as soon as it is received
+                with client_socket.makefile("rb") as stream:
+                    for line in stream:
+                        self.__handle_event(line)
+            except OSError as err:
+                LOGGER.warning(f"Connection to the presence service lost: {err}")
+            finally:
+                with self.__lock:
+                    self.__socket = None
+                client_socket.close()
+
+            if not self.__exit_event.is_set():
+                LOGGER.warning("The presence service closed the connection")
+                self.__on_service_unreachable()
+                self.__exit_event.wait(config.PRESENCE_RECONNECT_DELAY)
+
+    def __on_service_unreachable(self):
+        """ Reports the screen ON, unless already done, since the service turns the backlight on when it stops """
+        if self.__is_on is not True:
+            self.__is_on = True
+            self.__on_screen_state(True)
+
+    def __handle_event(self, line: bytes):
+        try:
+            event = json.loads(line)
+            if event["event"] == "screen":
+                self.__is_on = bool(event["on"])
+                self.__on_screen_state(self.__is_on)
+            elif event["event"] == "presence" and self.__on_presence is not None:
+                self.__on_presence(bool(event["motion"]))
+        except (ValueError, KeyError, TypeError) as err:
+            LOGGER.warning(f"Invalid event received from the presence service: {err}")
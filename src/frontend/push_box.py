@@ -0,0 +1,167 @@
+from communicator import BoxInterface, BoxStatus, HouseMode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Callable
+import config
+import collections
+import dataclasses
+import hmac
+import json
+import threading
+import time
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PushBoxInterface(BoxInterface):
+    """
+    Receives status change notifications pushed by the home automation box on a local HTTP listener.
+
+    The box notifies changes with a POST request to /status, either with an empty body, in which case the status is
+    read from the wrapped interface, or with the status as JSON (in the info_display.php format, optionally with a
+    "timestamp" field holding the time.time() at which the change occurred), in which case no request is sent to the
+    box. The requests must carry the shared token in an "Authorization: Bearer <token>" header. Status reads that
+    don't follow a notification are delegated to the wrapped interface, which is then polled at the
+    PUSH_HEARTBEAT_INTERVAL. The statuses following a notification carry the time at which it was received, from which
+    the latency of their display is measured.
+    """
+
+    def __init__(self, box: BoxInterface, parse_status: Optional[Callable[[dict], BoxStatus]] = None,
+                 host: str = config.PUSH_LISTEN_HOST, port: int = config.PUSH_LISTEN_PORT,
+                 token: str = config.PUSH_TOKEN):
+        if token == "":
+            raise ValueError("A shared token is required to receive the home automation box notifications")
+
+        self.__box = box
+        self.__authorization = f"Bearer {token}".encode()
+        self.__parse_status = parse_status
+        self.__lock = threading.Lock()
+        self.__pushed_status: Optional[BoxStatus] = None
+        self.__notified_time: Optional[float] = None
+        self.__listener: Optional[Callable[[], None]] = None
+        self.__notification_count = 0
+
+        # Latencies from the reception of the last notifications to the display of their status, in seconds
+        self.__display_latencies = collections.deque(maxlen=config.HTTP_LATENCY_HISTORY_SIZE)
+        self.__last_displayed_time: Optional[float] = None
+
+        push_box = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                push_box._handle_post(self)
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        LOGGER.info(f"Listening for home automation box notifications on {host}:{port}")
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    @property
+    def port(self) -> int:
+        """ Returns the port the notifications are received on """
+        return self.__server.server_port
+
+    @property
+    def notification_count(self) -> int:
+        """ Returns the number of notifications received """
+        with self.__lock:
+            return self.__notification_count
+
+    @property
+    def last_display_latency(self) -> Optional[float]:
+        """ Returns the duration in seconds from the reception of the last notification to the display of its status """
+        return self.__display_latencies[-1] if self.__display_latencies else None
+
+    @property
+    def average_display_latency(self) -> Optional[float]:
+        """
+        Returns the average duration in seconds from the reception of the last notifications to the display of their
+        status
+        """
+        return sum(self.__display_latencies) / len(self.__display_latencies) if self.__display_latencies else None
+
+    @property
+    def refresh_interval(self) -> Optional[float]:
+        return config.PUSH_HEARTBEAT_INTERVAL
+
+    def set_status_listener(self, listener: Optional[Callable[[], None]]):
+        with self.__lock:
+            self.__listener = listener
+
+    def read_status(self) -> BoxStatus:
+        with self.__lock:
+            status = self.__pushed_status
+            self.__pushed_status = None
+            notified_time = self.__notified_time
+            self.__notified_time = None
+
+        if status is not None:
+            return status
+        status = self.__box.read_status()
+        if notified_time is not None:
+            status = dataclasses.replace(status, received_time=notified_time)
+        return status
+
+    def write_house_mode(self, mode: HouseMode) -> bool:
+        return self.__box.write_house_mode(mode)
+
+    def record_display(self, status: BoxStatus):
+        """ Records the latency of the display of a status; called from the main loop once the status is displayed """
+        if status.received_time is None or status.received_time == self.__last_displayed_time:
+            return
+
+        # The same notification is displayed again when the status is only marked stale or pending
+        self.__last_displayed_time = status.received_time
+        latency = time.monotonic() - status.received_time
+        self.__display_latencies.append(latency)
+        LOGGER.info(f"Status change displayed {latency * 1000:.1f}ms after its notification was received (average "
+                    f"{self.average_display_latency * 1000:.1f}ms)")
+
+    def close(self):
+        """ Stops listening for notifications """
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def _handle_post(self, handler: BaseHTTPRequestHandler):
+        received_time = time.monotonic()
+        if handler.path != "/status":
+            handler.send_error(404)
+            return
+        if not hmac.compare_digest(handler.headers.get("Authorization", "").encode(), self.__authorization):
+            LOGGER.warning(f"Unauthorized notification received from {handler.client_address[0]}")
+            handler.send_error(401)
+            return
+
+        try:
+            length = int(handler.headers.get("Content-Length", 0))
+            body = handler.rfile.read(length) if length > 0 else b""
+
+            status = None
+            if body and self.__parse_status is not None:
+                data = json.loads(body)
+                data.setdefault("timestamp", time.time())
+                status = dataclasses.replace(self.__parse_status(data), received_time=received_time)
+        except Exception as err:
+            LOGGER.error(f"Invalid notification received from the home automation box: {err}")
+            handler.send_error(400)
+            return
+
+        handler.send_response(204)
+        handler.end_headers()
+
+        with self.__lock:
+            self.__notification_count += 1
+            if status is not None:
+                self.__pushed_status = status
+            else:
+                self.__notified_time = received_time
+            listener = self.__listener
+
+        LOGGER.debug("Status change notification received from the home automation box")
+        if listener is not None:
+            listener()
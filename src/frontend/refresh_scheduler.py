@@ -0,0 +1,152 @@
+import config
+import abc
+import enum
+import random
+from typing import Optional
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RefreshScheduler(abc.ABC):
+    """
+    Decides when the status of the home automation box is read next.
+
+    Schedulers are only called from the communicator background engine and don't need to be thread safe.
+    """
+
+    @abc.abstractmethod
+    def get_next_delay(self) -> float:
+        """ Returns the delay in seconds before the next status read """
+        pass
+
+    def on_read_success(self, changed: bool):
+        """ Called after the status was read successfully; changed is True if the status values changed """
+        pass
+
+    def on_read_failure(self):
+        """ Called after the status could not be read """
+        pass
+
+    def on_house_mode_written(self):
+        """ Called after a house mode was written to the home automation box on user request """
+        pass
+
+
+class FixedRefreshScheduler(RefreshScheduler):
+    """ Reads the status at a fixed interval, and faster for a few reads after a user action """
+
+    def __init__(self, normal_interval: float = config.NORMAL_REFRESH_INTERVAL,
+                 fast_interval: float = config.FAST_REFRESH_INTERVAL,
+                 fast_refresh_count: int = config.AFTER_ACTION_FAST_REFRESH_DURATION):
+        self.__normal_interval = normal_interval
+        self.__fast_interval = fast_interval
+        self.__fast_refresh_count = fast_refresh_count
+        self.__fast_refresh_counter = 0
+
+    def get_next_delay(self) -> float:
+        if self.__fast_refresh_counter > 0:
+            self.__fast_refresh_counter -= 1
+            return self.__fast_interval
+        return self.__normal_interval
+
+    def on_house_mode_written(self):
+        self.__fast_refresh_counter = self.__fast_refresh_count
+
+
+class CircuitState(enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+
+
+class AdaptiveRefreshScheduler(RefreshScheduler):
+    """
+    Adapts the status read interval to the activity of the house and to the health of the home automation box:
+    - after a user action, the status is read at the fast interval for a few reads;
+    - while the values change, the interval is halved down to the fast interval, and while the house is quiet it
+      grows by the relax factor up to the quiet interval;
+    - on consecutive failures, the interval backs off exponentially (with jitter to avoid synchronized retries) and
+      after a number of failures the circuit breaker opens: the box is only probed once per open duration until a
+      read succeeds again.
+    """
+
+    def __init__(self, normal_interval: float = config.NORMAL_REFRESH_INTERVAL,
+                 fast_interval: float = config.FAST_REFRESH_INTERVAL,
+                 fast_refresh_count: int = config.AFTER_ACTION_FAST_REFRESH_DURATION,
+                 quiet_interval: float = config.QUIET_REFRESH_INTERVAL,
+                 relax_factor: float = config.REFRESH_RELAX_FACTOR,
+                 backoff_max_interval: float = config.ERROR_BACKOFF_MAX_INTERVAL,
+                 backoff_jitter: float = config.ERROR_BACKOFF_JITTER,
+                 circuit_breaker_threshold: int = config.CIRCUIT_BREAKER_THRESHOLD,
+                 circuit_breaker_open_duration: float = config.CIRCUIT_BREAKER_OPEN_DURATION,
+                 rng: Optional[random.Random] = None):
+        self.__normal_interval = normal_interval
+        self.__fast_interval = fast_interval
+        self.__fast_refresh_count = fast_refresh_count
+        self.__quiet_interval = max(quiet_interval, normal_interval)
+        self.__relax_factor = relax_factor
+        self.__backoff_max_interval = backoff_max_interval
+        self.__backoff_jitter = backoff_jitter
+        self.__circuit_breaker_threshold = circuit_breaker_threshold
+        self.__circuit_breaker_open_duration = circuit_breaker_open_duration
+        self.__rng = rng if rng is not None else random.Random()
+
+        self.__interval = normal_interval
+        self.__fast_refresh_counter = 0
+        self.__consecutive_failures = 0
+        self.__circuit_state = CircuitState.CLOSED
+
+    @property
+    def circuit_state(self) -> CircuitState:
+        """ Returns the state of the circuit breaker """
+        return self.__circuit_state
+
+    @property
+    def consecutive_failures(self) -> int:
+        """ Returns the number of consecutive failed status reads """
+        return self.__consecutive_failures
+
+    def get_next_delay(self) -> float:
+        if self.__circuit_state == CircuitState.OPEN:
+            return self.__circuit_breaker_open_duration
+
+        if self.__consecutive_failures > 0:
+            backoff = min(self.__backoff_max_interval,
+                          self.__normal_interval * 2 ** (self.__consecutive_failures - 1))
+            return backoff * self.__rng.uniform(1 - self.__backoff_jitter, 1 + self.__backoff_jitter)
+
+        if self.__fast_refresh_counter > 0:
+            self.__fast_refresh_counter -= 1
+            return self.__fast_interval
+
+        return self.__interval
+
+    def on_read_success(self, changed: bool):
+        if self.__circuit_state == CircuitState.OPEN:
+            LOGGER.info("Home automation box reachable again, closing the circuit breaker")
+        self.__circuit_state = CircuitState.CLOSED
+        self.__consecutive_failures = 0
+
+        if changed:
+            self.__interval = max(self.__fast_interval, self.__interval / 2)
+        else:
+            self.__interval = min(self.__quiet_interval, self.__interval * self.__relax_factor)
+
+    def on_read_failure(self):
+        self.__consecutive_failures += 1
+        if self.__circuit_state == CircuitState.CLOSED \
+                and self.__consecutive_failures >= self.__circuit_breaker_threshold:
+            LOGGER.warning(f"{self.__consecutive_failures} consecutive failures, opening the circuit breaker: the "
+                           f"home automation box will be probed every {self.__circuit_breaker_open_duration}s")
+            self.__circuit_state = CircuitState.OPEN
+
+    def on_house_mode_written(self):
+        self.__fast_refresh_counter = self.__fast_refresh_count
+        self.__interval = self.__normal_interval
+
+
+def create_refresh_scheduler(normal_interval: float) -> RefreshScheduler:
+    """ Creates the refresh scheduler selected in the configuration """
+    if config.REFRESH_SCHEDULER == "fixed":
+        return FixedRefreshScheduler(normal_interval=normal_interval)
+    return AdaptiveRefreshScheduler(normal_interval=normal_interval)
@@ -0,0 +1,91 @@
+from os import path
+import functools
+import io
+import json
+import pygame
+import pygame_gui
+from pygame_gui.core.utility import FontResource
+from asset_bundle import AssetBundle, load_asset_bundle
+from typing import Tuple, Optional
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Fonts of the user interface: regular, bold, italic and bold italic files per font name
+UI_FONTS = {
+    "roboto": [path.join("assets", "fonts", "roboto-regular.ttf"),
+               path.join("assets", "fonts", "roboto-bold.ttf"),
+               path.join("assets", "fonts", "roboto-italic.ttf"),
+               path.join("assets", "fonts", "roboto-bold-italic.ttf")],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_asset_bundle() -> Optional[AssetBundle]:
+    """ Returns the precompiled assets, loaded once for the whole process, or None if there is no usable bundle """
+    return load_asset_bundle()
+
+
+@functools.lru_cache(maxsize=None)
+def get_ui_manager(size: Tuple[int, int]) -> pygame_gui.UIManager:
+    """
+    Returns the user interface manager shared by all the screens: the fonts are registered and the theme is parsed
+    once for the whole process.
+    """
+    LOGGER.debug("Loading the user interface theme and fonts")
+    manager = pygame_gui.UIManager(size)
+    for font_name, font_paths in UI_FONTS.items():
+        manager.add_font_paths(font_name, *font_paths)
+    bundle = get_asset_bundle()
+    if bundle is not None:
+        preload_bundle_fonts(manager, bundle)
+    manager.ui_theme.load_theme(bundle.theme if bundle is not None else path.join("assets", "theme.json"))
+    return manager
+
+
+def preload_bundle_fonts(manager: pygame_gui.UIManager, bundle: AssetBundle):
+    """
+    Loads the fonts used by the theme from the asset bundle, so that pygame_gui finds them already loaded instead of
+    reading the font files. The fonts of other sizes or styles are still loaded from the font files, if ever used.
+    """
+    font_dictionary = manager.get_theme().get_font_dictionary()
+    for element in json.load(bundle.theme).values():
+        font = element.get("font")
+        if font is None or "size" not in font or font["name"] not in UI_FONTS:
+            continue
+        font_files = bundle.get_font(font["name"])
+        if font_files is None:
+            continue
+
+        # Same font identifier and styling as pygame_gui
+        font_size = int(font["size"])
+        bold = bool(int(font.get("bold", 0)))
+        italic = bool(int(font.get("italic", 0)))
+        font_id = font_dictionary.create_font_id(font_size, font["name"], bold, italic)
+        if font_id in font_dictionary.loaded_fonts:
+            continue
+        style_index = int(bold) + 2 * int(italic)
+        resource = FontResource(font_id=font_id, size=font_size, style={"bold": bold, "italic": italic},
+                                location=UI_FONTS[font["name"]][style_index])
+        resource.loaded_font = pygame.font.Font(io.BytesIO(font_files[style_index]), font_size)
+        resource.loaded_font.set_bold(bold)
+        resource.loaded_font.set_italic(italic)
+        font_dictionary.loaded_fonts[font_id] = resource
+
+
+@functools.lru_cache(maxsize=None)
+def get_image(file_path: str) -> pygame.Surface:
+    """
+    Returns an image loaded once for the whole process, converted to the display format when the display is set so
+    that it is blitted faster. The returned surface is shared and must not be modified.
+    """
+    bundle = get_asset_bundle()
+    if bundle is not None:
+        image = bundle.get_image(file_path)
+        if image is not None:
+            return image
+
+    image = pygame.image.load(file_path)
+    if pygame.display.get_surface() is not None:
+        image = image.convert_alpha()
+    return image
@@ -1,26 +1,46 @@
 from __future__ import annotations
-from os import path
 
 import pygame
 import pygame_gui
+from pygame_gui.core import UIContainer
+import resources
+from frame_profiler import FrameProfiler
 import abc
-from typing import Union, Type
+from typing import Union, Type, List, Optional, Dict, Tuple
 
 
 class Screen(abc.ABC):
     def __init__(self, surface: pygame.Surface):
+        # All the screens share the same UI manager; each screen's elements live in a container of their own which
+        # is only visible while the screen is active, and is built on the first activation
         self.__surface = surface
-        self.__manager = pygame_gui.UIManager(self.__surface.get_size())
-        self.__manager.add_font_paths(font_name="roboto",
-                                      regular_path=path.join("assets", "fonts", "roboto-regular.ttf"),
-                                      bold_path=path.join("assets", "fonts", "roboto-bold.ttf"),
-                                      italic_path=path.join("assets", "fonts", "roboto-italic.ttf"),
-                                      bold_italic_path=path.join("assets", "fonts", "roboto-bold-italic.ttf"))
-        self.__manager.ui_theme.load_theme(path.join("assets", "theme.json"))
-        self.__initialized = False
+        self.__manager = resources.get_ui_manager(self.__surface.get_size())
+        self.__container: Optional[UIContainer] = None
         self.__next_screen: Union[Type[Screen], None] = None
 
-    def _on_create_controls(self, manager: pygame_gui.UIManager):
+        # Dirty rectangles tracking
+        self.__pending_dirty_rects: List[pygame.Rect] = []
+        self.__dirty_rects: List[pygame.Rect] = []
+        self.__drawn_sprites: Dict[int, Tuple[pygame.sprite.Sprite, pygame.Surface, pygame.Rect]] = {}
+
+    @property
+    def dirty_rects(self) -> List[pygame.Rect]:
+        """ Returns the rectangles of the surface that were redrawn during the last call to run() """
+        return self.__dirty_rects
+
+    def invalidate(self, rect: Optional[pygame.Rect] = None):
+        """ Marks a region of the surface (or the whole surface if rect is None) to be redrawn on the next run() """
+        if rect is None:
+            rect = self.__surface.get_rect()
+        self.__pending_dirty_rects.append(pygame.Rect(rect))
+
+    def _on_create_controls(self, manager: pygame_gui.UIManager, container: UIContainer):
+        """
+        Creates the UI elements of the screen, in the container; called on the first activation.
+
+        The container shows all its elements again each time the screen is activated: screens hiding some elements
+        must restore their visibility in _on_activated() or _on_loop().
+        """
         pass
 
     def _on_activated(self, previous_screen: Union[Type[Screen], None]):
@@ -33,20 +53,48 @@ class Screen(abc.ABC):
         pass
 
     def _on_loop(self):
+        """
+        Updates the screen state before drawing.
+
+        Screens drawing anything besides their UI elements must call invalidate() with the area of the
+        custom drawing whenever it changes, so that it gets redrawn.
+        """
         pass
 
+    def _on_get_next_update_delay(self) -> Optional[float]:
+        """
+        Returns the delay in seconds after which the screen content changes on its own (e.g. a clock), or None
+        if the screen only changes in response to events.
+        """
+        return None
+
     def _on_draw(self, surface: pygame.Surface):
+        """
+        Draws the screen on the surface.
+
+        The surface clipping area is set to the region being redrawn; drawing outside of it has no effect.
+        """
         self.__manager.draw_ui(surface)
 
     def activate(self, previous_screen: Union[Type[Screen], None]):
-        if not self.__initialized:
-            self._on_create_controls(self.__manager)
-            self.__initialized = True
+        if self.__container is None:
+            self.__container = UIContainer(relative_rect=self.__surface.get_rect(), manager=self.__manager)
+            self._on_create_controls(self.__manager, self.__container)
+        else:
+            self.__container.show()
 
         self._on_activated(previous_screen)
+        self.__drawn_sprites.clear()
+        self.invalidate()
 
     def deactivate(self):
         self._on_deactivated()
+        if self.__container is not None:
+            self.__container.hide()
+
+    def get_next_update_delay(self) -> Optional[float]:
+        """ Returns the delay in seconds before the screen must be run again even if no event occurs """
+        return self._on_get_next_update_delay()
 
     def handle_event(self, event: pygame.event.Event):
         self.__manager.process_events(event)
@@ -54,12 +102,69 @@ class Screen(abc.ABC):
         if next_screen is not None:
             self.__next_screen = next_screen
 
-    def run(self, time_delta: float) -> Union[Type[Screen], None]:
+    def run(self, time_delta: float, profiler: Optional[FrameProfiler] = None) -> Union[Type[Screen], None]:
         self._on_loop()
+        if profiler is not None:
+            profiler.mark("screen_loop")
         self.__manager.update(time_delta)
-        self.__surface.fill(pygame.Color('#000000'))
-        self._on_draw(self.__surface)
+        if profiler is not None:
+            profiler.mark("ui_update")
+
+        # Redraw only the regions that changed since the last frame
+        self.__invalidate_changed_sprites()
+        self.__dirty_rects = self.__merge_rects(self.__pending_dirty_rects)
+        self.__pending_dirty_rects = []
+        for rect in self.__dirty_rects:
+            self.__surface.set_clip(rect)
+            self.__surface.fill(pygame.Color('#000000'))
+            self._on_draw(self.__surface)
+        self.__surface.set_clip(None)
+        if profiler is not None:
+            profiler.mark("draw")
 
         next_screen = self.__next_screen
         self.__next_screen = None
         return next_screen
+
+    def __invalidate_changed_sprites(self):
+        """ Invalidates the areas of the UI elements that were added, removed, moved, hidden or re-rendered """
+
+        drawn_sprites = {}
+        for sprite in self.__manager.get_sprite_group().sprites():
+            if not sprite.visible or sprite.image is None:
+                continue
+
+            # The image and rect are kept by reference: pygame_gui replaces the image surface when an
+            # element is re-rendered and keeping it alive guarantees that its id cannot be recycled.
+            drawn_sprites[id(sprite)] = (sprite, sprite.image, pygame.Rect(sprite.rect))
+            previous = self.__drawn_sprites.pop(id(sprite), None)
+            if previous is None:
+                self.invalidate(sprite.rect)
+            elif previous[1] is not sprite.image or previous[2] != sprite.rect:
+                self.invalidate(previous[2])
+                self.invalidate(sprite.rect)
+
+        # Remaining sprites were drawn on the previous frame but are now hidden or gone
+        for _, _, rect in self.__drawn_sprites.values():
+            self.invalidate(rect)
+
+        self.__drawn_sprites = drawn_sprites
+
+    def __merge_rects(self, rects: List[pygame.Rect]) -> List[pygame.Rect]:
+        """ Clips the rectangles to the surface and merges the overlapping ones """
+
+        surface_rect = self.__surface.get_rect()
+        merged: List[pygame.Rect] = []
+        for rect in rects:
+            rect = rect.clip(surface_rect)
+            if rect.width == 0 or rect.height == 0:
+                continue
+
+            # Absorb every rectangle overlapping the new one until no overlap is left
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect.union_ip(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+
+        return merged
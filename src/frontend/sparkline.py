@@ -0,0 +1,88 @@
+import pygame
+from status_history import StatusHistory
+from array import array
+
+
+class Sparkline:
+    """
+    Small line chart of a status history column over the last duration seconds, one bucket per pixel column.
+
+    The chart is drawn on its own surface when the history or the time bucket changes; in between, update() only
+    compares two numbers and the screen blits the surface when it redraws the region.
+    """
+
+    def __init__(self, rect: pygame.Rect, history: StatusHistory, column: str, duration: float,
+                 color: pygame.Color, aggregate: str = "mean"):
+        self.__rect = pygame.Rect(rect)
+        self.__history = history
+        self.__column = column
+        self.__duration = duration
+        self.__color = color
+        self.__aggregate = aggregate
+
+        # Buffers reused by each update
+        self.__values = array("d", bytes(8 * self.__rect.width))
+        self.__surface = pygame.Surface(self.__rect.size, pygame.SRCALPHA)
+        self.__bucket_duration = duration / self.__rect.width
+
+        # History generation and time bucket of the drawn chart
+        self.__generation = -1
+        self.__bucket = -1
+
+    @property
+    def rect(self) -> pygame.Rect:
+        """ Returns the area of the chart on the screen """
+        return self.__rect
+
+    @property
+    def surface(self) -> pygame.Surface:
+        """ Returns the drawn chart """
+        return self.__surface
+
+    def update(self, now: float) -> bool:
+        """
+        Redraws the chart if the history changed or the time moved to the next bucket.
+
+        returns: True if the chart was redrawn; otherwise, False.
+        """
+        generation = self.__history.generation
+        bucket = int(now // self.__bucket_duration)
+        if generation == self.__generation and bucket == self.__bucket:
+            return False
+        self.__generation = generation
+        self.__bucket = bucket
+
+        # The chart ends with the current bucket, so that the buckets do not shift within a pixel column
+        end_time = (bucket + 1) * self.__bucket_duration
+        self.__history.downsample(self.__column, end_time - self.__duration, end_time, self.__values,
+                                  self.__aggregate)
+        self.__draw()
+        return True
+
+    def __draw(self):
+        self.__surface.fill((0, 0, 0, 0))
+
+        values = self.__values
+        minimum = min((value for value in values if value == value), default=None)
+        if minimum is None:
+            return
+        maximum = max(value for value in values if value == value)
+
+        # Values are scaled to the height of the chart; a flat history is drawn in the middle
+        bottom = self.__rect.height - 1
+        scale = bottom / (maximum - minimum) if maximum > minimum else 0
+        offset = bottom / 2 if maximum == minimum else 0
+
+        previous_point = None
+        for x, value in enumerate(values):
+            if value != value:
+                # No samples in this bucket: the line is interrupted
+                previous_point = None
+                continue
+
+            point = (x, round(bottom - offset - (value - minimum) * scale))
+            if previous_point is None:
+                self.__surface.set_at(point, self.__color)
+            else:
+                pygame.draw.line(self.__surface, self.__color, previous_point, point)
+            previous_point = point
@@ -0,0 +1,52 @@
+from communicator import BoxStatus, HouseMode
+from typing import Optional
+import json
+import os
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StatusCache:
+    """ Persists the last known status of the home automation box to a small JSON file """
+
+    def __init__(self, file_path: str):
+        self.__file_path = file_path
+
+    def load(self) -> Optional[BoxStatus]:
+        """ Returns the cached status, marked as stale, or None if there is no usable cached status """
+        try:
+            with open(self.__file_path, "r") as file:
+                data = json.load(file)
+
+            return BoxStatus(is_valid=True,
+                             lights_on=data["lights_on"],
+                             doors_opened=data["doors_opened"],
+                             outside_temperature=data["outside_temperature"],
+                             house_mode=HouseMode(data["house_mode"]) if data["house_mode"] is not None else None,
+                             timestamp=data["timestamp"],
+                             is_stale=True)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            LOGGER.warning(f"Failed to load the cached status from '{self.__file_path}': {err}")
+            return None
+
+    def save(self, status: BoxStatus):
+        """ Saves the status to the cache file """
+        data = {
+            "lights_on": status.lights_on,
+            "doors_opened": status.doors_opened,
+            "outside_temperature": status.outside_temperature,
+            "house_mode": status.house_mode.value if status.house_mode is not None else None,
+            "timestamp": status.timestamp,
+        }
+
+        # Write to a temporary file first so that an interrupted write cannot corrupt the cache
+        try:
+            temp_file_path = f"{self.__file_path}.tmp"
+            with open(temp_file_path, "w") as file:
+                json.dump(data, file)
+            os.replace(temp_file_path, self.__file_path)
+        except Exception as err:
+            LOGGER.warning(f"Failed to save the status to '{self.__file_path}': {err}")
@@ -0,0 +1,226 @@
+from communicator import BoxStatus, HouseMode
+from typing import Optional
+import config
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Columns of the history: name -> array type code. The columns are stored one after the other in this order, from the
+# largest to the smallest item size, so that every column is aligned on its item size.
+COLUMNS = {
+    "timestamp": "d",
+    "outside_temperature": "f",
+    "lights_on": "H",
+    "doors_opened": "H",
+    "house_mode": "b",
+}
+
+# Header of the history file: magic, capacity, number of samples, index of the next sample to write
+HEADER = struct.Struct("<8sIII")
+HEADER_SIZE = 32
+MAGIC = b"BOXHIST1"
+
+# Codes of the house modes in the house_mode column; -1 when the house mode is unknown
+HOUSE_MODE_CODES = {mode: code for code, mode in enumerate(HouseMode)}
+
+
+class StatusHistory:
+    """
+    Fixed-size history of the home automation box status values, sampled at most every sample interval.
+
+    The samples are stored in a ring of array columns, without a Python object per sample, in memory or in a
+    memory-mapped file that is reloaded on restart. Missing temperatures are stored as NaN. The history is written by
+    the communicator and read by the user interface, from different threads.
+    """
+
+    def __init__(self, capacity: int = config.STATUS_HISTORY_SIZE,
+                 sample_interval: float = config.STATUS_HISTORY_SAMPLE_INTERVAL, file_path: Optional[str] = None):
+        self.__capacity = capacity
+        self.__sample_interval = sample_interval
+        self.__lock = threading.Lock()
+        self.__generation = 0
+
+        size = HEADER_SIZE + sum(struct.calcsize(type_code) * capacity for type_code in COLUMNS.values())
+        self.__mmap: Optional[mmap.mmap] = None
+        if file_path is not None:
+            self.__buffer = self.__open_file(file_path, size)
+        else:
+            self.__buffer = memoryview(bytearray(size))
+
+        self.__columns = {}
+        offset = HEADER_SIZE
+        for name, type_code in COLUMNS.items():
+            column_size = struct.calcsize(type_code) * capacity
+            self.__columns[name] = self.__buffer[offset:offset + column_size].cast(type_code)
+            offset += column_size
+
+        magic, file_capacity, self.__count, self.__next_index = HEADER.unpack_from(self.__buffer)
+        if magic != MAGIC or file_capacity != capacity or self.__count > capacity or self.__next_index >= capacity:
+            if magic != bytes(len(MAGIC)):
+                LOGGER.warning(f"Discarding the incompatible status history in '{file_path}'")
+            self.__count = 0
+            self.__next_index = 0
+            self.__write_header()
+        elif self.__count > 0:
+            LOGGER.info(f"Loaded {self.__count} status history samples from '{file_path}'")
+
+    @property
+    def capacity(self) -> int:
+        """ Returns the maximum number of samples kept """
+        return self.__capacity
+
+    @property
+    def count(self) -> int:
+        """ Returns the number of samples kept """
+        with self.__lock:
+            return self.__count
+
+    @property
+    def generation(self) -> int:
+        """ Returns a number incremented each time a sample is recorded """
+        with self.__lock:
+            return self.__generation
+
+    def record(self, status: BoxStatus, now: Optional[float] = None) -> bool:
+        """
+        Records the values of a status, unless the last sample is more recent than the sample interval.
+
+        returns: True if a sample was recorded; otherwise, False.
+        """
+        if now is None:
+            now = time.time()
+
+        with self.__lock:
+            if not self.__columns:
+                # Closed while a status read was in progress
+                return False
+
+            timestamps = self.__columns["timestamp"]
+            if self.__count > 0:
+                last_timestamp = timestamps[(self.__next_index - 1) % self.__capacity]
+                if last_timestamp <= now < last_timestamp + self.__sample_interval:
+                    return False
+
+            index = self.__next_index
+            timestamps[index] = now
+            self.__columns["outside_temperature"][index] = \
+                status.outside_temperature if status.outside_temperature is not None else math.nan
+            self.__columns["lights_on"][index] = min(len(status.lights_on), 0xffff)
+            self.__columns["doors_opened"][index] = min(len(status.doors_opened), 0xffff)
+            self.__columns["house_mode"][index] = HOUSE_MODE_CODES.get(status.house_mode, -1)
+
+            # The header is updated last, so that an interrupted write leaves the previous samples consistent
+            self.__next_index = (index + 1) % self.__capacity
+            self.__count = min(self.__count + 1, self.__capacity)
+            self.__write_header()
+            self.__generation += 1
+        return True
+
+    def downsample(self, column: str, start_time: float, end_time: float, values, aggregate: str = "mean") -> int:
+        """
+        Aggregates the samples of a column between start_time and end_time into len(values) buckets of equal
+        duration, without allocating: values is a preallocated array('d') or list, which receives the mean, minimum
+        or maximum of each bucket, or NaN for buckets without samples.
+
+        returns: the number of buckets with samples.
+        """
+        bucket_count = len(values)
+        for bucket in range(bucket_count):
+            values[bucket] = math.nan
+        if bucket_count == 0 or end_time <= start_time:
+            return 0
+
+        is_mean = aggregate == "mean"
+        is_max = aggregate == "max"
+        if not is_mean and not is_max and aggregate != "min":
+            raise ValueError(f"Unknown aggregate '{aggregate}'")
+
+        bucket_duration = (end_time - start_time) / bucket_count
+        filled_buckets = 0
+        current_bucket = -1
+        total = 0.0
+        sample_count = 0
+        with self.__lock:
+            if not self.__columns:
+                return 0
+            timestamps = self.__columns["timestamp"]
+            data = self.__columns[column]
+
+            # The samples are walked from the newest, and the walk stops at the first sample older than start_time
+            index = self.__next_index
+            for _ in range(self.__count):
+                index = index - 1 if index > 0 else self.__capacity - 1
+                timestamp = timestamps[index]
+                if timestamp < start_time:
+                    break
+                if timestamp >= end_time:
+                    continue
+                value = data[index]
+                if value != value or (column == "house_mode" and value < 0):
+                    # NaN or unknown value
+                    continue
+
+                bucket = min(int((timestamp - start_time) / bucket_duration), bucket_count - 1)
+                if bucket != current_bucket:
+                    if sample_count > 0:
+                        values[current_bucket] = total / sample_count if is_mean else total
+                        filled_buckets += 1
+                    current_bucket = bucket
+                    total = 0.0 if is_mean else value
+                    sample_count = 0
+
+                if is_mean:
+                    total += value
+                elif is_max:
+                    total = max(total, value)
+                else:
+                    total = min(total, value)
+                sample_count += 1
+
+        if sample_count > 0:
+            values[current_bucket] = total / sample_count if is_mean else total
+            filled_buckets += 1
+        return filled_buckets
+
+    def flush(self):
+        """ Writes the samples to the history file, if any """
+        with self.__lock:
+            if self.__mmap is not None:
+                self.__mmap.flush()
+
+    def close(self):
+        """ Writes the samples to the history file, if any, and releases the history """
+        with self.__lock:
+            if not self.__columns:
+                return
+            for column in self.__columns.values():
+                column.release()
+            self.__columns.clear()
+            self.__buffer.release()
+            if self.__mmap is not None:
+                self.__mmap.flush()
+                self.__mmap.close()
+                self.__mmap = None
+
+    def __open_file(self, file_path: str, size: int) -> memoryview:
+        """ Maps the history file in memory, creating or resizing it as needed """
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                # A file of another size cannot be reused: start over with an empty history
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.__mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        return memoryview(self.__mmap)
+
+    def __write_header(self):
+        """ Writes the header; must be called with the lock held """
+        HEADER.pack_into(self.__buffer, 0, MAGIC, self.__capacity, self.__count, self.__next_index)
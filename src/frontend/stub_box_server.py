@@ -0,0 +1,170 @@
+"""
+Local stand-in for the home automation box HTTP API, for development and benchmarks.
+
+Run it with `python stub_box_server.py` and point config.HOME_AUTOMATION_BOX_URL to
+http://127.0.0.1:8080/script/?exec=info_display.php
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Optional
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.request
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StubBoxServer:
+    def __init__(self, port: int = 0, delay: float = 0, failure_rate: float = 0, use_etag: bool = False):
+        self.__delay = delay
+        self.__use_etag = use_etag
+        self.__failure_rate = failure_rate
+        self.__lock = threading.Lock()
+        self.__status = {
+            "lights_on": [],
+            "doors_opened": [],
+            "outside_temperature": 12.5,
+            "house_mode": "present",
+        }
+        self.__request_count = 0
+        self.__connection_count = 0
+        self.__thread: Optional[threading.Thread] = None
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 enables keep-alive connections
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                stub._on_connection()
+
+            def do_GET(self):
+                stub._handle_get(self)
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.__server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """ Returns the status URL of the stub server, to be used as HOME_AUTOMATION_BOX_URL """
+        return f"http://127.0.0.1:{self.__server.server_port}/script/?exec=info_display.php"
+
+    @property
+    def request_count(self) -> int:
+        """ Returns the number of requests received """
+        with self.__lock:
+            return self.__request_count
+
+    @property
+    def connection_count(self) -> int:
+        """ Returns the number of TCP connections accepted """
+        with self.__lock:
+            return self.__connection_count
+
+    def update_status(self, **values):
+        """ Updates the values returned by the server (lights_on, doors_opened, outside_temperature, house_mode) """
+        with self.__lock:
+            self.__status.update(values)
+
+    def push(self, url: str, token: str):
+        """ Notifies the status to a push listener, as the home automation box script would """
+        with self.__lock:
+            data = dict(self.__status, timestamp=time.time())
+        request = urllib.request.Request(url, data=json.dumps(data).encode("utf-8"), method="POST",
+                                         headers={"Content-Type": "application/json",
+                                                  "Authorization": f"Bearer {token}"})
+        urllib.request.urlopen(request, timeout=5).close()
+
+    def start(self):
+        """ Starts serving requests in a background thread """
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """ Stops serving requests """
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def _on_connection(self):
+        with self.__lock:
+            self.__connection_count += 1
+
+    def _handle_get(self, handler: BaseHTTPRequestHandler):
+        with self.__lock:
+            self.__request_count += 1
+
+        if self.__delay > 0:
+            time.sleep(self.__delay)
+
+        if random.random() < self.__failure_rate:
+            handler.send_error(503)
+            return
+
+        query = parse_qs(urlparse(handler.path).query)
+        with self.__lock:
+            if "set_mode" in query:
+                self.__status["house_mode"] = query["set_mode"][0]
+            body = json.dumps(self.__status).encode("utf-8")
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+        if handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        if self.__use_etag:
+            handler.send_header("ETag", etag)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Home automation box stub server')
+    parser.add_argument("-p", "--port", type=int, default=8080, help="The port to listen on; Default '8080'.")
+    parser.add_argument("-d", "--delay", type=float, default=0, help="The response delay in seconds; Default '0'.")
+    parser.add_argument("-f", "--failure-rate", type=float, default=0,
+                        help="The ratio of requests answered with an error; Default '0'.")
+    parser.add_argument("-e", "--etag", action="store_true", help="Send ETag headers and honor If-None-Match.")
+    parser.add_argument("--push-url",
+                        help="The URL to push status changes to, e.g. 'http://127.0.0.1:8081/status'.")
+    parser.add_argument("--push-interval", type=float, default=5,
+                        help="The interval in seconds between simulated status changes when pushing; Default '5'.")
+    parser.add_argument("--push-token", default="", help="The shared token of the push listener.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+    server = StubBoxServer(port=args.port, delay=args.delay, failure_rate=args.failure_rate, use_etag=args.etag)
+    LOGGER.info(f"Serving the home automation box stub on {server.url}")
+    server.start()
+    try:
+        door_opened = False
+        while True:
+            if args.push_url:
+                # Simulate a door opening or closing and notify it
+                time.sleep(args.push_interval)
+                door_opened = not door_opened
+                opened = ["Entrance"] if door_opened else []
+                server.update_status(doors_opened=opened)
+                server.push(args.push_url, args.push_token)
+                LOGGER.info(f"Pushed opened doors {opened} to {args.push_url}")
+            else:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,163 @@
+"""
+Local stand-in for the presence and display power service (src/pir/pirscreenmanager.py), for development and tests.
+
+Run it with `python stub_presence_server.py` and set config.PRESENCE_SOCKET to the socket path: the screen is turned
+OFF and ON at a fixed interval, and the forced mode sent by the frontend is applied like the service does.
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from typing import List, Optional
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StubPresenceServer:
+    def __init__(self, socket_path: str):
+        self.__socket_path = socket_path
+        self.__lock = threading.Lock()
+        self.__clients: List[socket.socket] = []
+        self.__motion = True
+        self.__auto_screen_on = True
+        self.__forced_screen_on: Optional[bool] = None
+        self.__forced_screen_client: Optional[socket.socket] = None
+        self.__commands: List[dict] = []
+        self.__thread: Optional[threading.Thread] = None
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.__server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server_socket.bind(socket_path)
+        self.__server_socket.listen()
+
+    @property
+    def client_count(self) -> int:
+        """ Returns the number of connected clients """
+        with self.__lock:
+            return len(self.__clients)
+
+    @property
+    def commands(self) -> List[dict]:
+        """ Returns the commands received, in order """
+        with self.__lock:
+            return list(self.__commands)
+
+    @property
+    def screen_on(self) -> bool:
+        """ Returns the published screen state """
+        with self.__lock:
+            return self.__get_screen_on()
+
+    def set_motion(self, motion: bool):
+        """ Simulates the PIR sensor: a motion turns the screen ON and its end turns it OFF, without timeout """
+        with self.__lock:
+            was_on = self.__get_screen_on()
+            self.__motion = motion
+            self.__auto_screen_on = motion
+            self.__publish({"event": "presence", "motion": motion})
+            if self.__get_screen_on() != was_on:
+                self.__publish_screen()
+
+    def start(self):
+        """ Starts accepting clients in a background thread """
+        self.__thread = threading.Thread(target=self.__accept_clients)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """ Disconnects the clients and stops accepting new ones """
+        self.__server_socket.shutdown(socket.SHUT_RDWR)
+        self.__server_socket.close()
+        with self.__lock:
+            for client in self.__clients:
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.__clients.clear()
+        if os.path.exists(self.__socket_path):
+            os.unlink(self.__socket_path)
+
+    def __get_screen_on(self) -> bool:
+        return self.__forced_screen_on if self.__forced_screen_on is not None else self.__auto_screen_on
+
+    def __publish(self, event: dict):
+        """ Sends an event to all the clients; must be called with the lock held """
+        line = json.dumps(event).encode() + b"\n"
+        for client in list(self.__clients):
+            try:
+                client.sendall(line)
+            except OSError:
+                self.__clients.remove(client)
+
+    def __publish_screen(self):
+        """ Sends the screen state to all the clients; must be called with the lock held """
+        self.__publish({"event": "screen", "on": self.__get_screen_on(), "forced": self.__forced_screen_on})
+
+    def __accept_clients(self):
+        while True:
+            try:
+                client, _ = self.__server_socket.accept()
+            except OSError:
+                return
+
+            with self.__lock:
+                self.__clients.append(client)
+                client.sendall(json.dumps({"event": "screen", "on": self.__get_screen_on(),
+                                           "forced": self.__forced_screen_on}).encode() + b"\n")
+                client.sendall(json.dumps({"event": "presence", "motion": self.__motion}).encode() + b"\n")
+            threading.Thread(target=self.__read_commands, args=(client,), daemon=True).start()
+
+    def __read_commands(self, client: socket.socket):
+        try:
+            with client.makefile("rb") as stream:
+                for line in stream:
+                    command = json.loads(line)
+                    LOGGER.debug(f"Command received: {command}")
+                    with self.__lock:
+                        self.__commands.append(command)
+                        if command.get("command") == "force_screen":
+                            self.__forced_screen_on = command.get("on")
+                            self.__forced_screen_client = client if self.__forced_screen_on is not None else None
+                            self.__publish_screen()
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.__lock:
+                if client in self.__clients:
+                    self.__clients.remove(client)
+                # The PIR sensor is followed again once the client forcing the screen disconnects
+                if client is self.__forced_screen_client:
+                    was_on = self.__get_screen_on()
+                    self.__forced_screen_on = None
+                    self.__forced_screen_client = None
+                    if self.__get_screen_on() != was_on:
+                        self.__publish_screen()
+            client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Presence and display power service stub')
+    parser.add_argument("-s", "--socket", default="/tmp/pirscreen.sock",
+                        help="The path of the Unix socket; Default '/tmp/pirscreen.sock'.")
+    parser.add_argument("-i", "--interval", type=float, default=10,
+                        help="The interval in seconds between simulated motion changes; Default '10'.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+    server = StubPresenceServer(args.socket)
+    LOGGER.info(f"Serving the presence service stub on {args.socket}")
+    server.start()
+    try:
+        motion = True
+        while True:
+            time.sleep(args.interval)
+            motion = not motion
+            server.set_motion(motion)
+            LOGGER.info(f"Simulated motion {motion}")
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,30 +1,80 @@
 import config
+import pygame
 from gpiozero import Device, DigitalInputDevice, DigitalOutputDevice
+from gpiozero.pins import Factory
 from gpiozero.pins.mock import MockFactory
+from display_power import DisplayPowerBackend, create_display_power_backend
+from presence_client import PresenceClient
 from typing import Optional
-import subprocess
+import threading
 import logging
 
 LOGGER = logging.getLogger(__name__)
 
+# PyGame event posted when the TFT screen must be turned ON or OFF, either because the PIR sensor detected a motion or
+# the screen timeout expired, or because the forced mode changed. The event has the following attribute:
+# - is_on: True if the screen must be turned ON; otherwise, False
+# The state of the screen is actually changed by TftManager.update().
+SCREEN_STATE_CHANGED = pygame.event.custom_type()
+
 
 class TftManager:
-    def __init__(self):
-        if config.DEBUG_MODE:
+    """
+    Turns the TFT screen ON when the PIR sensor detects a motion and OFF after SCREEN_TIMEOUT seconds without motion.
+
+    The PIR sensor edges are handled by gpiozero callbacks and a single timeout timer, which post SCREEN_STATE_CHANGED
+    events: nothing is polled from the main loop.
+
+    When the path of the presence service socket is set, the service owns the PIR sensor, the backlight and the display
+    power instead: the screen state it publishes is followed and the forced mode is forwarded to it.
+    """
+
+    def __init__(self, pin_factory: Optional[Factory] = None, screen_timeout: float = config.SCREEN_TIMEOUT,
+                 display_power: Optional[DisplayPowerBackend] = None, presence_socket: str = config.PRESENCE_SOCKET):
+        self.__screen_timeout = screen_timeout
+        self.__lock = threading.Lock()
+        self.__timeout_timer: Optional[threading.Timer] = None
+        self.__motion_is_on = True
+        self.__is_on: Optional[bool] = None
+        self.__forced_is_on: Optional[bool] = None
+        self.__pir: Optional[DigitalInputDevice] = None
+        self.__backlight: Optional[DigitalOutputDevice] = None
+        self.__display_power: Optional[DisplayPowerBackend] = None
+        self.__presence_client: Optional[PresenceClient] = None
+
+        if presence_socket != "":
+            # The service sends the screen state on connection; until then the screen is ON
+            LOGGER.debug(f"Following the screen state of the presence service at '{presence_socket}'")
+            self.__presence_client = PresenceClient(presence_socket, on_screen_state=self.__on_service_screen_state)
+            self.__post_state(True)
+            return
+
+        if pin_factory is None and config.DEBUG_MODE:
             LOGGER.warning("Using mocked GPIO pins")
             Device.pin_factory = MockFactory()
 
+        # Mocked PIR sensors detect a motion until told otherwise, so that the screen stays ON
+        factory = pin_factory if pin_factory is not None else Device.pin_factory
+        if isinstance(factory, MockFactory):
+            factory.pin(config.PIN_PIR).drive_high()
+
         LOGGER.debug(f"Setting up PIR sensor on GPIO {config.PIN_PIR}")
-        self.__pir = DigitalInputDevice(config.PIN_PIR)
+        self.__pir = DigitalInputDevice(config.PIN_PIR, pin_factory=pin_factory)
 
         LOGGER.debug(f"Setting up screen backlight on GPIO {config.PIN_BACKLIGHT}")
-        self.__backlight = DigitalOutputDevice(config.PIN_BACKLIGHT)
+        self.__backlight = DigitalOutputDevice(config.PIN_BACKLIGHT, pin_factory=pin_factory)
         self.__backlight.on()
 
-        LOGGER.debug(f"Using X Display '{config.SCREEN_DISPLAY}' and {config.SCREEN_TIMEOUT}s off timeout for screen.")
+        LOGGER.debug(f"Using '{config.DISPLAY_POWER_BACKEND}' display power control and {screen_timeout}s off timeout "
+                     f"for screen.")
+        self.__display_power = display_power if display_power is not None else create_display_power_backend()
 
-        self.__is_on: Optional[bool] = None
-        self.__forced_is_on: Optional[bool] = None
+        # The screen starts ON, and goes OFF after the timeout if no motion is detected
+        self.__pir.when_activated = self.__on_motion_started
+        self.__pir.when_deactivated = self.__on_motion_stopped
+        if not self.__pir.is_active:
+            self.__on_motion_stopped()
+        self.__post_state(True)
 
     @property
     def is_on(self) -> Optional[bool]:
@@ -34,35 +84,40 @@ class TftManager:
     def set_forced_mode(self, is_on: Optional[bool]):
         """ For debug purposes this allows to force the status of the TFT on or off """
         LOGGER.debug(f"Forced TFT mode set to {is_on}")
+        if self.__presence_client is not None:
+            # The service publishes the resulting screen state
+            self.__presence_client.set_forced_mode(is_on)
+            return
+
         self.__forced_is_on = is_on
+        with self.__lock:
+            motion_is_on = self.__motion_is_on
+        self.__post_state(is_on if is_on is not None else motion_is_on)
 
     def update(self) -> bool:
         """
-        Updates the status of the TFT screen.
+        Updates the status of the TFT screen; called when a SCREEN_STATE_CHANGED event is received.
 
         returns: True if the state of the screen has changed; otherwise, False.
         """
 
         try:
             # determine whether the TFT must be ON/OFF
-            tft_inactive_time = 0
-            if not config.DEBUG_MODE:
-                tft_inactive_time = self.__pir.inactive_time
-                LOGGER.debug(f"TFT inactive time = {tft_inactive_time} (Screen timeout = {config.SCREEN_TIMEOUT})")
-
             if self.__forced_is_on is not None:
                 new_is_on = self.__forced_is_on
             else:
-                new_is_on = tft_inactive_time is None or tft_inactive_time < config.SCREEN_TIMEOUT
+                with self.__lock:
+                    new_is_on = self.__motion_is_on
 
             # Update the members
             has_changed = new_is_on != self.__is_on
             self.__is_on = new_is_on
 
-            # Toggle the screen ON or OFF if the state changed
+            # Toggle the screen ON or OFF if the state changed, unless the presence service already did
             if has_changed:
                 LOGGER.info(f"Screen state changed to {self.__is_on}")
-                self.set_screen(self.is_on)
+                if self.__presence_client is None:
+                    self.set_screen(self.is_on)
 
             # Done !
             return has_changed
@@ -70,8 +125,21 @@ class TftManager:
             LOGGER.error(f"Failed to set the TFT on/off: {err}")
             return False
 
+    def close(self):
+        """ Stops handling the PIR sensor and releases the GPIO pins """
+        if self.__presence_client is not None:
+            self.__presence_client.close()
+            return
+
+        with self.__lock:
+            self.__cancel_timeout_timer()
+        self.__pir.close()
+        self.__backlight.close()
+        if self.__display_power is not None:
+            self.__display_power.close()
+
     def set_screen(self, enabled: bool):
-        """ Activates or deactivates the display """
+        """ Activates or deactivates the display; the display power state is changed in the background """
 
         try:
 
@@ -81,18 +149,18 @@ class TftManager:
                 # Turn the backlight ON
                 self.__backlight.on()
 
-                # Execute xset to set the TFT on
-                if not config.DEBUG_MODE:
-                    subprocess.call(f"xset -display {config.SCREEN_DISPLAY} -dpms", shell=True)
+                # Turn the display ON
+                if self.__display_power is not None:
+                    self.__display_power.set_power(True)
             else:
                 LOGGER.debug("Disabling display")
 
                 # Turn the backlight OFF
                 self.__backlight.off()
 
-                # Execute xset to set the TFT off
-                if not config.DEBUG_MODE:
-                    subprocess.call(f"xset -display {config.SCREEN_DISPLAY} dpms force off", shell=True)
+                # Turn the display OFF
+                if self.__display_power is not None:
+                    self.__display_power.set_power(False)
 
         except Exception as err:
             if enabled:
@@ -104,3 +172,49 @@ class TftManager:
                 LOGGER.info("Display enabled")
             else:
                 LOGGER.info("Display disabled")
+
+    def __on_service_screen_state(self, is_on: bool):
+        """ Called from the presence client thread when the service turned the screen ON or OFF """
+        with self.__lock:
+            self.__motion_is_on = is_on
+        self.__post_state(is_on)
+
+    def __on_motion_started(self):
+        """ Called from a gpiozero thread when the PIR sensor detects a motion """
+        LOGGER.debug("Motion detected")
+        with self.__lock:
+            self.__cancel_timeout_timer()
+            was_on = self.__motion_is_on
+            self.__motion_is_on = True
+        if not was_on:
+            self.__post_state(True)
+
+    def __on_motion_stopped(self):
+        """ Called from a gpiozero thread when the PIR sensor stops detecting a motion """
+        LOGGER.debug(f"No more motion, screen timeout in {self.__screen_timeout}s")
+        with self.__lock:
+            self.__cancel_timeout_timer()
+            self.__timeout_timer = threading.Timer(self.__screen_timeout, self.__on_timeout)
+            self.__timeout_timer.daemon = True
+            self.__timeout_timer.start()
+
+    def __on_timeout(self):
+        """ Called from the timer thread when no motion was detected for the screen timeout """
+        with self.__lock:
+            if self.__timeout_timer is None or threading.current_thread() is not self.__timeout_timer:
+                return
+            self.__timeout_timer = None
+            self.__motion_is_on = False
+        self.__post_state(False)
+
+    def __cancel_timeout_timer(self):
+        """ Cancels the screen timeout; must be called with the lock held """
+        if self.__timeout_timer is not None:
+            self.__timeout_timer.cancel()
+            self.__timeout_timer = None
+
+    @staticmethod
+    def __post_state(is_on: bool):
+        """ Asks the main loop to update the state of the screen """
+        if pygame.display.get_init():
+            pygame.event.post(pygame.event.Event(SCREEN_STATE_CHANGED, is_on=is_on))
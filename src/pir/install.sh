@@ -3,6 +3,7 @@
 sudo mkdir -v -p /usr/local/bin/pirscreen              
 sudo cp -v pirscreenmanager.py /usr/local/bin/pirscreen/pirscreenmanager.py
 sudo chmod -v 755 /usr/local/bin/pirscreen/pirscreenmanager.py
+sudo cp -v mockgpio.py /usr/local/bin/pirscreen/mockgpio.py
 
 sudo cp -v pirscreen.sh /etc/init.d/pirscreen.sh
 sudo chmod -v 755 /etc/init.d/pirscreen.sh
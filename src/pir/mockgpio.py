@@ -0,0 +1,57 @@
+''' In-memory stand-in for the subset of RPi.GPIO used by pirscreenmanager, to run it without a Raspberry Pi '''
+
+import threading
+
+BCM = 11
+IN = 1
+OUT = 0
+LOW = 0
+HIGH = 1
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+LOCK = threading.Lock()
+PIN_VALUES = {}
+PIN_CALLBACKS = {}
+
+def setmode(mode):
+    pass
+
+def setup(channel, direction):
+    with LOCK:
+        PIN_VALUES.setdefault(channel, LOW)
+
+def output(channel, value):
+    with LOCK:
+        PIN_VALUES[channel] = HIGH if value else LOW
+
+def input(channel):
+    with LOCK:
+        return PIN_VALUES.get(channel, LOW)
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    with LOCK:
+        PIN_CALLBACKS[channel] = (edge, callback)
+
+def remove_event_detect(channel):
+    with LOCK:
+        PIN_CALLBACKS.pop(channel, None)
+
+def cleanup():
+    with LOCK:
+        PIN_VALUES.clear()
+        PIN_CALLBACKS.clear()
+
+def setInput(channel, value):
+    ''' Drives an input pin, calling its edge callback from the calling thread like the RPi.GPIO event thread '''
+    with LOCK:
+        previous_value = PIN_VALUES.get(channel, LOW)
+        new_value = HIGH if value else LOW
+        PIN_VALUES[channel] = new_value
+        edge, callback = PIN_CALLBACKS.get(channel, (None, None))
+
+    if callback is None or previous_value == new_value:
+        return
+    if edge == BOTH or (edge == RISING) == (new_value == HIGH):
+        callback(channel)
@@ -24,6 +24,12 @@ DAEMON_NAME=pirscreen
 #                        '30'.
 #  -d DISPLAY, --display DISPLAY
 #                        The X display identifier; Default ':0'.
+#  -s SOCKET, --socket SOCKET
+#                        The path of the Unix socket publishing the presence
+#                        and screen events, empty to disable; Default
+#                        '/run/pirscreen.sock'.
+#  -m, --mock-gpio       Use an in-memory GPIO stand-in instead of RPi.GPIO, to
+#                        run without a Raspberry Pi.
 DAEMON_OPTS=""
 
 # This next line determines what user the script runs as.
@@ -1,7 +1,19 @@
 #!/usr/bin/python3
 
-import RPi.GPIO as GPIO
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+import mockgpio
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import socket
 import subprocess
+import sys
 import time
 import argparse
 import logging
@@ -16,10 +28,45 @@ LOG_LEVEL = logging.DEBUG  # Could be e.g. "DEBUG" or "WARNING"
 LOG_FILENAME = "/tmp/pirscreenmanager.log"
 SCREEN_TIMEOUT = 30
 DISPLAY = ":0"
+SOCKET_PATH = "/run/pirscreen.sock"
+
+# DPMS levels of the X DPMS extension
+DPMS_MODE_OFF = 3
 
 # Log
 LOGGER = logging.getLogger(__name__)
 
+# Persistent X server connection used to set the DPMS state, opened on first use
+X11 = None
+XEXT = None
+X_DISPLAY = None
+X_ERROR_HANDLER = None
+
+# Last xset process started when the X DPMS extension cannot be used
+XSET_PROCESS = None
+
+# PIR edges are signaled to the main loop by the GPIO event thread through a pipe, which unlike a thread event lets
+# signals interrupt the wait; the time of the first motion not handled yet is kept along
+PIR_EDGE_PIPE = None
+PIR_MOTION_TIME = None
+
+# Presence and screen state service: clients connected to the Unix socket receive JSON line events, and may force the
+# screen on or off
+SERVER_SOCKET = None
+CLIENTS = {}
+MOTION = None
+SCREEN_ON = True
+AUTO_SCREEN_ON = True
+FORCED_SCREEN_ON = None
+FORCED_SCREEN_CLIENT = None
+
+# Statistics: main loop wakeups since the start, and latency from the PIR edge to the backlight ON
+START_TIME = time.monotonic()
+WAKEUP_COUNT = 0
+BACKLIGHT_ON_COUNT = 0
+BACKLIGHT_ON_TOTAL_LATENCY = 0.0
+BACKLIGHT_ON_MAX_LATENCY = 0.0
+
 def parseCommandLine():
     ''' Parses the command line arguments and returns the argument values '''
     parser = argparse.ArgumentParser(description='PIR sensor screen service')
@@ -32,6 +79,13 @@ def parseCommandLine():
     parser.add_argument(
         "-d", "--display",
         help="The X display identifier; Default '" + DISPLAY + "'.")
+    parser.add_argument(
+        "-s", "--socket",
+        help="The path of the Unix socket publishing the presence and screen events, empty to disable; Default '"
+             + SOCKET_PATH + "'.")
+    parser.add_argument(
+        "-m", "--mock-gpio", action="store_true",
+        help="Use an in-memory GPIO stand-in instead of RPi.GPIO, to run without a Raspberry Pi.")
     
     return parser.parse_args()
 
@@ -61,9 +115,73 @@ def setupLoging():
     LOGGER.addHandler(fh)
     LOGGER.addHandler(ch)
 
-def setScreen(enabled):
-    ''' Activates or deactivates the display '''
-    
+def onXError(display, event):
+    ''' Logs X server errors instead of exiting as the default X error handler does '''
+    LOGGER.error("X server error while changing the display power state")
+    return 0
+
+def openDisplay():
+    ''' Returns the persistent X server connection, connecting on first use '''
+    global X11, XEXT, X_DISPLAY, X_ERROR_HANDLER
+
+    if X_DISPLAY is None:
+        X11 = ctypes.cdll.LoadLibrary(ctypes.util.find_library("X11") or "libX11.so.6")
+        X11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        X11.XOpenDisplay.restype = ctypes.c_void_p
+        X11.XFlush.argtypes = [ctypes.c_void_p]
+        X11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        X11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        XEXT = ctypes.cdll.LoadLibrary(ctypes.util.find_library("Xext") or "libXext.so.6")
+        XEXT.DPMSCapable.argtypes = [ctypes.c_void_p]
+        XEXT.DPMSEnable.argtypes = [ctypes.c_void_p]
+        XEXT.DPMSDisable.argtypes = [ctypes.c_void_p]
+        XEXT.DPMSForceLevel.argtypes = [ctypes.c_void_p, ctypes.c_ushort]
+
+        handler_type = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+        X11.XSetErrorHandler.argtypes = [handler_type]
+        X_ERROR_HANDLER = handler_type(onXError)
+        X11.XSetErrorHandler(X_ERROR_HANDLER)
+
+        display = X11.XOpenDisplay(DISPLAY.encode())
+        if not display:
+            raise ConnectionError("Cannot open X display '{}'".format(DISPLAY))
+        if not XEXT.DPMSCapable(display):
+            X11.XCloseDisplay(display)
+            raise RuntimeError("X display '{}' does not support DPMS".format(DISPLAY))
+        X_DISPLAY = display
+        LOGGER.info("Connected to X display '%s'", DISPLAY)
+
+    return X_DISPLAY
+
+def setDpms(enabled):
+    ''' Turns the display on/off like "xset -dpms" / "xset dpms force off", without spawning a shell '''
+    global XSET_PROCESS
+
+    try:
+        display = openDisplay()
+        if enabled:
+            XEXT.DPMSDisable(display)
+        else:
+            XEXT.DPMSEnable(display)
+            X11.XSync(display, 0)
+            time.sleep(0.1)
+            XEXT.DPMSForceLevel(display, DPMS_MODE_OFF)
+        X11.XFlush(display)
+    except (OSError, ConnectionError, RuntimeError) as err:
+        # Fall back to xset, started without a shell and without waiting for it
+        LOGGER.warning("Cannot use the X DPMS extension (%s), using xset", err)
+        if XSET_PROCESS is not None:
+            XSET_PROCESS.poll()
+        if enabled:
+            args = ["xset", "-display", DISPLAY, "-dpms"]
+        else:
+            args = ["xset", "-display", DISPLAY, "dpms", "force", "off"]
+        XSET_PROCESS = subprocess.Popen(args)
+
+def setScreen(enabled, motionTime=None):
+    ''' Activates or deactivates the display; motionTime is the time of the PIR edge that turns it on, if any '''
+    global BACKLIGHT_ON_COUNT, BACKLIGHT_ON_TOTAL_LATENCY, BACKLIGHT_ON_MAX_LATENCY
+
     if enabled:
         LOGGER.debug("Enabling display")
     else:
@@ -72,16 +190,15 @@ def setScreen(enabled):
     try:
         # Now we set the backlight
         GPIO.output(PIN_BACKLIGHT, enabled)
+        if motionTime is not None:
+            latency = time.monotonic() - motionTime
+            BACKLIGHT_ON_COUNT += 1
+            BACKLIGHT_ON_TOTAL_LATENCY += latency
+            BACKLIGHT_ON_MAX_LATENCY = max(BACKLIGHT_ON_MAX_LATENCY, latency)
+            LOGGER.debug("Backlight on %.2fms after the PIR edge", latency * 1000)
 
-        # Execute xset to set the TFT on/off
-        if enabled:
-            subprocess.call(
-                "xset -display {} -dpms".format(DISPLAY),
-                shell=True)
-        else:
-            subprocess.call(
-                "xset -display {} dpms force off".format(DISPLAY),
-                shell=True)
+        # Set the TFT on/off
+        setDpms(enabled)
 
     except Exception as err:
         if enabled:
@@ -96,9 +213,143 @@ def setScreen(enabled):
             LOGGER.info("Display disabled")
 
 
+def onPirEdge(channel):
+    ''' Called by the GPIO event thread on each PIR edge: wakes up the main loop '''
+    global PIR_MOTION_TIME
+
+    if PIR_MOTION_TIME is None and GPIO.input(channel) == GPIO.HIGH:
+        PIR_MOTION_TIME = time.monotonic()
+    try:
+        os.write(PIR_EDGE_PIPE[1], b"\0")
+    except BlockingIOError:
+        # The pipe is full of edges the main loop has not read yet
+        pass
+
+def logStatistics():
+    ''' Logs how often the main loop woke up and how fast the backlight was turned on '''
+    hours = max(time.monotonic() - START_TIME, 1) / 3600
+    LOGGER.info("%i wakeups in %.2f hours (%.1f per hour)", WAKEUP_COUNT, hours, WAKEUP_COUNT / hours)
+    if BACKLIGHT_ON_COUNT > 0:
+        LOGGER.info("Backlight on after a PIR edge %i times: average %.2fms, max %.2fms", BACKLIGHT_ON_COUNT,
+                    BACKLIGHT_ON_TOTAL_LATENCY / BACKLIGHT_ON_COUNT * 1000, BACKLIGHT_ON_MAX_LATENCY * 1000)
+
+def openServerSocket():
+    ''' Starts listening for the service clients, if the socket is enabled '''
+    global SERVER_SOCKET
+
+    if not SOCKET_PATH:
+        return
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    SERVER_SOCKET = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    SERVER_SOCKET.bind(SOCKET_PATH)
+    # The frontend does not run as root
+    os.chmod(SOCKET_PATH, 0o666)
+    SERVER_SOCKET.listen()
+    SERVER_SOCKET.setblocking(False)
+    LOGGER.info("Publishing the presence and screen events on '%s'", SOCKET_PATH)
+
+def closeServerSocket():
+    ''' Disconnects the clients and stops listening '''
+    for client in list(CLIENTS):
+        dropClient(client)
+    if SERVER_SOCKET is not None:
+        SERVER_SOCKET.close()
+        os.unlink(SOCKET_PATH)
+
+def dropClient(client):
+    ''' Closes the connection to a client, and follows the PIR again if that client forced the screen '''
+    global FORCED_SCREEN_ON, FORCED_SCREEN_CLIENT
+
+    CLIENTS.pop(client, None)
+    client.close()
+    if client is FORCED_SCREEN_CLIENT:
+        LOGGER.info("The client forcing the screen disconnected, following the PIR sensor again")
+        FORCED_SCREEN_ON = None
+        FORCED_SCREEN_CLIENT = None
+
+def sendEvent(client, event):
+    ''' Sends an event to a client; clients too slow to take it are dropped rather than blocking the service '''
+    line = (json.dumps(event) + "\n").encode()
+    try:
+        if client.send(line) != len(line):
+            raise BlockingIOError()
+    except OSError as err:
+        LOGGER.warning("Dropping a client that cannot take the events: %s", err)
+        dropClient(client)
+
+def publishEvent(event):
+    ''' Sends an event to all the clients '''
+    for client in list(CLIENTS):
+        sendEvent(client, event)
+
+def getScreenEvent():
+    return {"event": "screen", "on": SCREEN_ON, "forced": FORCED_SCREEN_ON}
+
+def acceptClient():
+    ''' Accepts a client and sends it the current state '''
+    try:
+        client, _ = SERVER_SOCKET.accept()
+    except BlockingIOError:
+        return
+    client.setblocking(False)
+    CLIENTS[client] = b""
+    LOGGER.debug("Client connected, %i clients", len(CLIENTS))
+    sendEvent(client, getScreenEvent())
+    if client in CLIENTS:
+        sendEvent(client, {"event": "presence", "motion": MOTION})
+
+def readClientCommands(client):
+    ''' Reads the commands sent by a client '''
+    global FORCED_SCREEN_ON, FORCED_SCREEN_CLIENT
+
+    try:
+        data = client.recv(4096)
+    except BlockingIOError:
+        return
+    except OSError:
+        data = b""
+    if not data:
+        LOGGER.debug("Client disconnected")
+        dropClient(client)
+        return
+
+    lines = (CLIENTS[client] + data).split(b"\n")
+    CLIENTS[client] = lines.pop()
+    for line in lines:
+        try:
+            command = json.loads(line)
+        except ValueError:
+            LOGGER.warning("Invalid command received: %s", line)
+            continue
+        if command.get("command") == "force_screen":
+            FORCED_SCREEN_ON = command.get("on")
+            FORCED_SCREEN_CLIENT = client if FORCED_SCREEN_ON is not None else None
+            LOGGER.info("Screen forced to '%s'", FORCED_SCREEN_ON)
+            publishEvent(getScreenEvent())
+
+def applyScreenState(motionTime=None):
+    ''' Turns the screen on or off as the PIR sensor or the forced mode require, and publishes the changes '''
+    global SCREEN_ON
+
+    screen_on = FORCED_SCREEN_ON if FORCED_SCREEN_ON is not None else AUTO_SCREEN_ON
+    if screen_on != SCREEN_ON:
+        SCREEN_ON = screen_on
+        setScreen(screen_on, motionTime)
+        publishEvent(getScreenEvent())
+        if not screen_on:
+            logStatistics()
+
 def run():
     ''' Main program loop '''
-    try:        
+    global PIR_EDGE_PIPE, PIR_MOTION_TIME, WAKEUP_COUNT, MOTION, AUTO_SCREEN_ON
+
+    # Stopping the service cleans up like an interrupt
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    PIR_EDGE_PIPE = os.pipe()
+    os.set_blocking(PIR_EDGE_PIPE[1], False)
+
+    try:
         # Setup the GPIO pins
         LOGGER.debug("Setting up GPIO pins using BMC scheme")
         GPIO.setmode(GPIO.BCM)
@@ -107,44 +358,66 @@ def run():
         LOGGER.debug("Configuring GPIO %i as output", PIN_BACKLIGHT)
         GPIO.setup(PIN_BACKLIGHT, GPIO.OUT)
         GPIO.output(PIN_BACKLIGHT, True)
+        GPIO.add_event_detect(PIN_PIR, GPIO.BOTH, callback=onPirEdge)
         LOGGER.info("GPIO pins set-up complete.")
+        MOTION = GPIO.input(PIN_PIR) == GPIO.HIGH
+        openServerSocket()
 
-        # Initialize runtime values
-        timeout = time.time() + SCREEN_TIMEOUT
-        last_pir_value = None
+        # The screen starts on and goes off after the timeout unless a motion is detected
+        deadline = time.monotonic() + SCREEN_TIMEOUT
         while True:
 
-            # Wait for a change or a time-out and read PIR value
-            GPIO.wait_for_edge(PIN_PIR, GPIO.RISING, timeout=1000)
+            # Sleep until a PIR edge, a client request or the screen off deadline, there are no periodic wakeups
+            sockets = [PIR_EDGE_PIPE[0]] + list(CLIENTS) + ([SERVER_SOCKET] if SERVER_SOCKET is not None else [])
+            readable, _, _ = select.select(sockets, [], [],
+                                           None if deadline is None else max(0, deadline - time.monotonic()))
+            WAKEUP_COUNT += 1
+            is_edge = PIR_EDGE_PIPE[0] in readable
+            if is_edge:
+                os.read(PIR_EDGE_PIPE[0], 4096)
+            motion_time = PIR_MOTION_TIME
+            PIR_MOTION_TIME = None
             pir_value = GPIO.input(PIN_PIR) == GPIO.HIGH
+            now = time.monotonic()
+
+            if pir_value or motion_time is not None:
+                # Motion detected: the screen stays on while the PIR is high, then until the timeout
+                if is_edge:
+                    LOGGER.debug("PIR GPIO changed to '%s'", pir_value)
+                AUTO_SCREEN_ON = True
+                deadline = None if pir_value else now + SCREEN_TIMEOUT
+                if not MOTION:
+                    MOTION = True
+                    publishEvent({"event": "presence", "motion": True})
+            elif is_edge:
+                LOGGER.debug("PIR GPIO changed to '%s', screen timeout in %s sec", pir_value, SCREEN_TIMEOUT)
+                if AUTO_SCREEN_ON and deadline is None:
+                    deadline = now + SCREEN_TIMEOUT
+            elif deadline is not None and now >= deadline:
+                deadline = None
+                AUTO_SCREEN_ON = False
+            if MOTION and not pir_value:
+                MOTION = False
+                publishEvent({"event": "presence", "motion": False})
 
-            # Log a small message if the value changed
-            if pir_value != last_pir_value:
-                LOGGER.debug("PIR GPIO changed to '%s'", pir_value)
-
-            # Activates or deactivate the screen with timeout 
-            if pir_value:
-                # Updates timeout
-                timeout = time.time() + SCREEN_TIMEOUT
-                LOGGER.debug("Reset screen timeout to %s sec", round(timeout - time.time()))
-                # If PIR value changed to high, enable the screen !
-                if not last_pir_value:
-                    setScreen(True)
-            elif timeout > 0:
-                LOGGER.debug("Screen timeout in %s sec", round(timeout - time.time()))
-                if time.time() > timeout:
-                    timeout = 0
-                    setScreen(False)
-
-            # Updates the last seen PIR value
-            last_pir_value = pir_value
+            # The screen is switched before the clients are served, for the lowest latency
+            applyScreenState(motion_time)
+            for client in readable:
+                if client is SERVER_SOCKET:
+                    acceptClient()
+                elif client in CLIENTS:
+                    readClientCommands(client)
+            applyScreenState()
 
     except KeyboardInterrupt:
         LOGGER.info("Bye !")
     except Exception as err:
         LOGGER.error("Fatal error: %s", err)
     finally:
+        closeServerSocket()
+        GPIO.remove_event_detect(PIN_PIR)
         setScreen(True)
+        logStatistics()
         LOGGER.debug("Performing GPIO cleanup before leaving")
         GPIO.cleanup()
         LOGGER.info("GPIO cleanup done")
@@ -161,14 +434,24 @@ if __name__ == "__main__":
         SCREEN_TIMEOUT = args.timeout
     if args.display:
         DISPLAY = args.display
+    if args.socket is not None:
+        SOCKET_PATH = args.socket
+    if args.mock_gpio:
+        GPIO = mockgpio
 
     # Initialize the logging
     setupLoging()
+    if GPIO is None:
+        LOGGER.error("The RPi.GPIO module is not installed; use --mock-gpio to run without a Raspberry Pi")
+        sys.exit(1)
 
     # Print some debug info
     LOGGER.debug("Log file      : '%s'", LOG_FILENAME)
     LOGGER.debug("Screen timeout: %s", SCREEN_TIMEOUT)
     LOGGER.debug("X Display:      '%s'", DISPLAY)
+    LOGGER.debug("Socket:         '%s'", SOCKET_PATH)
+    if args.mock_gpio:
+        LOGGER.warning("Using the in-memory GPIO stand-in instead of RPi.GPIO")
 
     # Run the main loop
     run()
\ No newline at end of file